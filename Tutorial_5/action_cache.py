@@ -0,0 +1,59 @@
+import numpy as np
+import tempfile
+import hashlib
+import os
+
+# part of every key, increase it when a change of the solver gives different results for the same settings
+actionCacheVersion = 2
+
+
+# the key of an action sequence, a hash of everything the result of ActionSeqGenerator.generate depends on
+# any change of the arm, the path, the solver settings or the generation mode gives a different key
+# mode: how the sequence is generated, e.g. 'sequential' or ('parallel', numSegments, seedStride, seamTicks)
+def get_action_cache_key(actionGen, f, roboticArm, mode='sequential'):
+    xTicks = np.linspace(0.0, 1.0, actionGen.numSteps)
+    pathSamples = np.asarray([f(x) for x in xTicks], np.float64)
+
+    h = hashlib.sha256()
+    for array in [roboticArm.origin, roboticArm.armLengths, roboticArm.ps, roboticArm.ys, pathSamples]:
+        h.update(np.ascontiguousarray(array, np.float64).tobytes())
+
+    settings = (actionCacheVersion, mode, roboticArm.jacobianMode, roboticArm.diffEps, actionGen.numSteps,
+                actionGen.tolerance, actionGen.maxIterations, actionGen.pitchLimits, actionGen.yawLimits)
+    h.update(repr(settings).encode())
+
+    return h.hexdigest()[:32]
+
+
+# returns (ts, ps, ys, fromCache), the action sequence is loaded from cacheDirectory if it has been computed before
+# generateFunc(f, roboticArm): computes the sequence if it is not cached, actionGen.generate by default
+# mode: the generation mode of generateFunc, see get_action_cache_key
+def load_or_generate_actions(actionGen, f, roboticArm, cacheDirectory, generateFunc=None, mode='sequential'):
+    cacheKey = get_action_cache_key(actionGen, f, roboticArm, mode)
+    cachePath = os.path.join(cacheDirectory, 'actions_{}.npz'.format(cacheKey))
+
+    if os.path.exists(cachePath):
+        with np.load(cachePath) as cached:
+            return cached['ts'], cached['ps'], cached['ys'], True
+
+    if generateFunc is None:
+        generateFunc = actionGen.generate
+    ts, ps, ys = zip(*generateFunc(f, roboticArm))
+    ts = np.asarray(ts)
+    ps = np.asarray(ps)
+    ys = np.asarray(ys)
+
+    os.makedirs(cacheDirectory, exist_ok=True)
+    # write to a temporary file first so that an interrupted run does not leave a broken cache
+    # the name is unique so that runs started at the same time do not write into the same file
+    with tempfile.NamedTemporaryFile(dir=cacheDirectory, delete=False, suffix='.npz') as tempFile:
+        tempPath = tempFile.name
+        try:
+            np.savez(tempFile, ts=ts, ps=ps, ys=ys)
+        except BaseException:
+            tempFile.close()
+            os.remove(tempPath)
+            raise
+    os.replace(tempPath, cachePath)
+
+    return ts, ps, ys, False
@@ -1,4 +1,14 @@
 from Tutorial_5.robotic_arm import *
+from multiprocessing import Pool
+import time
+
+
+# solves one segment of the path in a worker process
+def _solve_segment(task):
+    actionGen, f, roboticArm, xs = task
+    startTime = time.time()
+    result, diagnostics = actionGen._solve_ticks(f, roboticArm, xs)
+    return result, diagnostics, time.time() - startTime
 
 # equal distance per time quantum
 class ActionSeqGenerator:
@@ -7,8 +17,51 @@ class ActionSeqGenerator:
         self.numSteps = numSteps
         self.distEps = 1.0e-3
 
-        # the error that is acceptable in solving for a new position
-        self.acceptableRelativeError = 0.03
+        # settings of RoboticArm.solve_position
+        self.tolerance = 1.0e-4
+        self.maxIterations = 50
+        # optional (min, max) angle limits
+        self.pitchLimits = None
+        self.yawLimits = None
+
+        # IKDiagnostics of every solved point of the last generate call
+        self.diagnostics = []
+        # solving time of each segment of the last generate_parallel call
+        self.segmentTimes = []
+
+    # solves the points f(x) of xs one by one, each solve starts from the previous solution
+    # roboticArm is left at the last solution
+    def _solve_ticks(self, f, roboticArm, xs):
+        result = []
+        diagnostics = []
+        for x in xs:
+            newPs, newYs, diag = roboticArm.solve_position(f(x), self.tolerance, self.maxIterations,
+                                                           pitchLimits=self.pitchLimits, yawLimits=self.yawLimits)
+            if not diag.converged:
+                print('unable to solve for x={} ({})'.format(x, diag))
+            diagnostics.append(diag)
+
+            result.append((x, newPs, newYs))
+            roboticArm.ps = newPs
+            roboticArm.ys = newYs
+
+        return result, diagnostics
+
+    # solves the first seamTicks ticks of segmentResult again, starting from prevResult, the end of the previous
+    # segment, the starting angles move linearly from the previous solution to the one of the segment
+    # segmentResult and diagnostics are updated in place
+    def _blend_seam(self, f, roboticArm, prevResult, segmentResult, diagnostics, seamTicks):
+        _, prevPs, prevYs = prevResult
+        numTicks = min(seamTicks, len(segmentResult))
+        for i in range(numTicks):
+            x, segmentPs, segmentYs = segmentResult[i]
+            w = (i + 1) / numTicks
+            roboticArm.ps = (1.0 - w) * prevPs + w * segmentPs
+            roboticArm.ys = (1.0 - w) * prevYs + w * segmentYs
+            prevPs, prevYs, diagnostics[i] = roboticArm.solve_position(f(x), self.tolerance, self.maxIterations,
+                                                                      pitchLimits=self.pitchLimits,
+                                                                      yawLimits=self.yawLimits)
+            segmentResult[i] = (x, prevPs, prevYs)
 
     # f: the parametric function on [0, 1]
     def generate(self, f, roboticArm):
@@ -23,41 +76,64 @@ class ActionSeqGenerator:
         result = []
         result.append([0.0, roboticArm.ps, roboticArm.ys])
 
-        lastX = xTicks[0]
         # put the starting point to the end
         xTicks.append(xTicks.pop(0))
 
-        while len(xTicks) > 2:
-            farX = xTicks.pop(0)
-
-            attempt = 0
-            testX = [farX]
-
-            solved = False
+        # the last two ticks are the end point and the starting point
+        segmentResult, self.diagnostics = self._solve_ticks(f, roboticArm, xTicks[:-2])
+        result.extend(segmentResult)
 
-            while attempt < 4:
-                newPos = f(testX[-1])
-                newPs, newYs, error  = roboticArm.solve_new_position(newPos)
-                if error < self.acceptableRelativeError:
-                    solved = True
-                    break
+        roboticArm.ps = initPs
+        roboticArm.ys = initYs
 
-                # error is too large, shrink the distance
-                testX.append((lastX + testX[-1]) / 2.0)
-                attempt += 1
+        return result
 
-            if not solved:
-                print('unable to solve for x={} (best relative error: {})'.format(farX, error))
+    # the same ticks as generate, but the path is split into numSegments segments that are solved
+    # in concurrency processes
+    # the first point of every segment (the seed) is solved first, walking along the path with a stride of
+    # seedStride ticks so that the seeds stay on the same solution branch, then every segment is solved
+    # from its seed
+    # the arm is redundant, so a seed can end up a little away from where the previous segment ends, the first
+    # seamTicks ticks of every segment are solved again from the end of the previous segment and blended into
+    # the segment so that the angles do not jump at the seams
+    def generate_parallel(self, f, roboticArm, numSegments, concurrency=None, seedStride=4, seamTicks=8):
+        # must share the same starting point
+        assert np.linalg.norm(f(0.0) - roboticArm.get_arm_position()) < self.distEps
 
-            result.append((testX[-1], newPs, newYs))
-            roboticArm.ps = newPs
-            roboticArm.ys = newYs
+        initPs = roboticArm.ps
+        initYs = roboticArm.ys
 
-            lastX = testX[-1]
+        # the same ticks as generate
+        xTicks = np.linspace(0.0, 1.0, self.numSteps)[1:-1].tolist()
+        segmentStarts = np.linspace(0, len(xTicks), numSegments, endpoint=False).astype(np.int64).tolist()
+        segmentStarts = sorted(set(segmentStarts))
+        segments = [xTicks[start:end] for start, end in zip(segmentStarts, segmentStarts[1:] + [len(xTicks)])]
+
+        # solve the seeds
+        seedTicks = sorted(set(list(range(0, len(xTicks), seedStride)) + segmentStarts))
+        seedResult, _ = self._solve_ticks(f, roboticArm, [xTicks[i] for i in seedTicks])
+        seeds = dict(zip(seedTicks, seedResult))
+
+        tasks = []
+        for start, xs in zip(segmentStarts, segments):
+            segmentArm = RoboticArm(roboticArm.armLengths, roboticArm.jacobianMode)
+            _, segmentArm.ps, segmentArm.ys = seeds[start]
+            tasks.append((self, f, segmentArm, xs))
+
+        with Pool(concurrency) as pool:
+            segmentResults = pool.map(_solve_segment, tasks, chunksize=1)
+
+        result = [[0.0, initPs, initYs]]
+        self.diagnostics = []
+        self.segmentTimes = []
+        for i, (segmentResult, diagnostics, elapsed) in enumerate(segmentResults):
+            if i > 0:
+                self._blend_seam(f, roboticArm, result[-1], segmentResult, diagnostics, seamTicks)
+            result.extend(segmentResult)
+            self.diagnostics.extend(diagnostics)
+            self.segmentTimes.append(elapsed)
 
         roboticArm.ps = initPs
         roboticArm.ys = initYs
 
         return result
-
-
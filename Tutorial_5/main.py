@@ -2,6 +2,7 @@ from scipy.interpolate import interp1d
 from gl_lib.transmat import *
 from Tutorial_5.robotic_arm import *
 from Tutorial_5.generate_action_sequence import *
+from Tutorial_5.action_cache import load_or_generate_actions
 
 
 tTicks = np.linspace(0, 2 * np.pi, 300)
@@ -21,16 +22,39 @@ transformedPoints = translate(initPos[0], initPos[1], initPos[2]) @ rotate(unit_
 transformedPoints = transformedPoints[:3, :]
 ellipseFunc = interp1d(tTicks / tTicks.max(), transformedPoints)
 
-print('solving inverse kinematics...')
-actionResult = actionGen.generate(ellipseFunc, roboticArm)
-print('finished!')
+# split the path into this many segments solved in parallel, None to solve the path sequentially
+# only pays off for long paths on machines with several cores
+ikSegments = None
+# settings of generate_parallel
+ikSeedStride = 4
+ikSeamTicks = 8
+
+# solved action sequences are saved here and reused while the arm, the path and the solver settings stay the same
+ikCacheDirectory = 'ik_cache'
+
+def generate_actions(f, arm):
+    if ikSegments is None:
+        return actionGen.generate(f, arm)
+    result = actionGen.generate_parallel(f, arm, ikSegments, seedStride=ikSeedStride, seamTicks=ikSeamTicks)
+    print('segment solving times: ' + ', '.join(['{:.3f}s'.format(x) for x in actionGen.segmentTimes]))
+    return result
 
-ts, ps, ys = zip(*actionResult)
-ts = np.asarray(ts)
-ps = np.asarray(ps)
-ys = np.asarray(ys)
-pFunc = interp1d(ts / ts.max(), ps.transpose())
-yFunc = interp1d(ts / ts.max(), ys.transpose())
+# solves the action sequence of the arm along the ellipse, returns the interpolated (pFunc, yFunc)
+# must only be called under the main guard, generate_parallel starts worker processes that import this module
+def solve_actions():
+    print('solving inverse kinematics...')
+    ikMode = 'sequential' if ikSegments is None else ('parallel', ikSegments, ikSeedStride, ikSeamTicks)
+    ts, ps, ys, fromCache = load_or_generate_actions(actionGen, ellipseFunc, roboticArm, ikCacheDirectory,
+                                                     generate_actions, ikMode)
+    if fromCache:
+        print('finished! (loaded from {})'.format(ikCacheDirectory))
+    else:
+        numIterations = [x.numIterations for x in actionGen.diagnostics]
+        numFailed = len([x for x in actionGen.diagnostics if not x.converged])
+        print('finished! (mean iterations: {:.2f}, max iterations: {}, failed: {})'.format(
+            np.mean(numIterations), np.max(numIterations), numFailed))
+
+    return interp1d(ts / ts.max(), ps.transpose()), interp1d(ts / ts.max(), ys.transpose())
 
 from OpenGL.GL import *
 from OpenGL.arrays.vbo import VBO
@@ -52,8 +76,8 @@ from gl_lib.fps_camera import *
 from gl_lib.gl_screenshot import save_screenshot_rgb
 import gl_lib.text_drawer
 from gl_lib.text_drawer import TextDrawer, TextDrawer_Outlined
-from misc.sphere_tessellation import uniform_tessellate_half_sphere
-from misc.cylinder_tessellation import uniform_tessellate_half_cylinder
+from misc.sphere_tessellation import uniform_tessellate_sphere
+from misc.cylinder_tessellation import uniform_tessellate_cylinder
 from Tutorial_5.shader import *
 
 windowSize = (800, 600)
@@ -88,16 +112,14 @@ camera.eyePos = np.array((0.0, 0.0, 5.0), np.float32)
 frameTicks = np.linspace(0.0, 1.0, numFramePerLoop)
 
 # get the vertex data of the sphere
-sphereTriangles = uniform_tessellate_half_sphere()
-sphereData = [np.concatenate([tri.vertices, tri.normals], axis=1) for tri in sphereTriangles]
-sphereVertexCount = 3 * len(sphereData)
-sphereData = np.asarray(sphereData).flatten().astype(np.float32)
+sphereData, sphereIndices = uniform_tessellate_sphere()
+sphereIndexCount = sphereIndices.size
+sphereData = sphereData.flatten()
 
 # get the vertex data of the cylinder
-cylinderTriangles = uniform_tessellate_half_cylinder()
-cylinderData = [np.concatenate([tri.vertices, tri.normals], axis=1) for tri in cylinderTriangles]
-cylinderVertexCount = 3 * len(cylinderData)
-cylinderData = np.asarray(cylinderData).flatten().astype(np.float32)
+cylinderData, cylinderIndices = uniform_tessellate_cylinder()
+cylinderIndexCount = cylinderIndices.size
+cylinderData = cylinderData.flatten()
 
 actualPathPos = [ellipseFunc(x) for x in actualPathTicks]
 actualPathPos.append(actualPathPos[0])
@@ -114,6 +136,70 @@ def get_spherical_coord(pitch, yaw):
         ]
     )
 
+
+# draw every joint and arm segment with one instanced draw call each
+useInstancing = True
+
+
+# the model matrices of all joints (including the base)
+def get_joint_model_matrices(origin, armEndPos):
+    jointPos = np.concatenate([origin[None, :], armEndPos], axis=0)
+    jointScales = np.full(jointPos.shape, jointScale)
+
+    return translate_batch(jointPos) @ scale_batch(jointScales)
+
+
+# the model matrices of all arm segments
+def get_arm_model_matrices(origin, armLengths, armEndPos, ps, ys):
+    sumPs = np.cumsum(ps)
+    sumYs = np.cumsum(ys)
+
+    armY = get_spherical_coord(sumPs, sumYs).transpose()
+    armX = get_spherical_coord(sumPs - np.pi / 2.0, sumYs + np.pi / 2.0).transpose()
+    armZ = normalized_rows(np.cross(armX, armY))
+
+    armMats = np.zeros((ps.size, 4, 4), np.float32)
+    armMats[:, :3, 0] = armX
+    armMats[:, :3, 1] = armY
+    armMats[:, :3, 2] = armZ
+    armMats[:, 3, 3] = 1.0
+
+    lastPos = np.concatenate([origin[None, :], armEndPos[:-1]], axis=0)
+    targetArmLengths = armLengths - 2.0 * armOffset
+    newPos = lastPos + armOffset * armY
+
+    positionMats = translate_batch(newPos) @ armMats
+
+    armScales = np.stack([np.full(ps.size, armScale), targetArmLengths, np.full(ps.size, armScale)], axis=1)
+
+    return positionMats @ scale_batch(armScales)
+
+
+# per-instance attributes store matrices column by column
+def get_instance_data(modelMatrices):
+    return np.ascontiguousarray(np.swapaxes(modelMatrices, 1, 2), np.float32).flatten()
+
+
+# the model matrix takes four attribute locations starting from firstLocation, one column each
+def attach_instance_matrices(vao, instanceVBO, firstLocation=2):
+    glBindVertexArray(vao)
+    instanceVBO.bind()
+    instanceVBO.copy_data()
+    for i in range(4):
+        glVertexAttribPointer(firstLocation + i, 4, GL_FLOAT, GL_FALSE, 16 * ctypes.sizeof(ctypes.c_float),
+                              ctypes.c_void_p(4 * i * ctypes.sizeof(ctypes.c_float)))
+        glEnableVertexAttribArray(firstLocation + i)
+        glVertexAttribDivisor(firstLocation + i, 1)
+    instanceVBO.unbind()
+    glBindVertexArray(0)
+
+
+def update_instance_data(instanceVBO, modelMatrices):
+    instanceVBO.set_array(get_instance_data(modelMatrices))
+    instanceVBO.bind()
+    instanceVBO.copy_data()
+    instanceVBO.unbind()
+
 def debug_message_callback(source, msg_type, msg_id, severity, length, raw, user):
     msg = raw[0:length]
     print('debug', source, msg_type, msg_id, severity, msg)
@@ -182,6 +268,8 @@ def create_uniform(programId, infos):
 
 if __name__ == '__main__':
 
+    pFunc, yFunc = solve_actions()
+
     # initialize glfw
     glfw.init()
 
@@ -222,12 +310,16 @@ if __name__ == '__main__':
 
     sphereDataVBO = VBO(sphereData, usage='GL_STATIC_DRAW')
     sphereDataVBO.create_buffers()
+    sphereEBO = VBO(sphereIndices, usage='GL_STATIC_DRAW', target='GL_ELEMENT_ARRAY_BUFFER')
+    sphereEBO.create_buffers()
 
     sphereVAO = glGenVertexArrays(1)
 
     glBindVertexArray(sphereVAO)
     sphereDataVBO.bind()
     sphereDataVBO.copy_data()
+    sphereEBO.bind()
+    sphereEBO.copy_data()
     glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * ctypes.sizeof(ctypes.c_float), ctypes.c_void_p(0))
     glEnableVertexAttribArray(0)
     glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * ctypes.sizeof(ctypes.c_float),
@@ -238,12 +330,16 @@ if __name__ == '__main__':
 
     cylinderDataVBO = VBO(cylinderData, usage='GL_STATIC_DRAW')
     cylinderDataVBO.create_buffers()
+    cylinderEBO = VBO(cylinderIndices, usage='GL_STATIC_DRAW', target='GL_ELEMENT_ARRAY_BUFFER')
+    cylinderEBO.create_buffers()
 
     cylinderVAO = glGenVertexArrays(1)
 
     glBindVertexArray(cylinderVAO)
     cylinderDataVBO.bind()
     cylinderDataVBO.copy_data()
+    cylinderEBO.bind()
+    cylinderEBO.copy_data()
     glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * ctypes.sizeof(ctypes.c_float), ctypes.c_void_p(0))
     glEnableVertexAttribArray(0)
     glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * ctypes.sizeof(ctypes.c_float),
@@ -267,16 +363,28 @@ if __name__ == '__main__':
     renderProgram = GLProgram(vertexShaderSource, fragmentShaderSource)
     renderProgram.compile_and_link()
 
+    instancedRenderProgram = GLProgram(instancedVertexShaderSource, fragmentShaderSource)
+    instancedRenderProgram.compile_and_link()
+
+    # instance buffers for the model matrices, initialized with the resting arm
+    initArmEndPos = roboticArm.get_all_arm_positions()
+    jointInstanceVBO = VBO(get_instance_data(get_joint_model_matrices(roboticArm.origin, initArmEndPos)),
+                           usage='GL_DYNAMIC_DRAW')
+    jointInstanceVBO.create_buffers()
+    attach_instance_matrices(sphereVAO, jointInstanceVBO)
+
+    armInstanceVBO = VBO(get_instance_data(get_arm_model_matrices(roboticArm.origin, roboticArm.armLengths,
+                                                                  initArmEndPos, roboticArm.ps, roboticArm.ys)),
+                         usage='GL_DYNAMIC_DRAW')
+    armInstanceVBO.create_buffers()
+    attach_instance_matrices(cylinderVAO, armInstanceVBO)
+
     lineProgram = GLProgram(lineVertexShaderSource, lineFragmentShaderSource, lineGeometryShaderSource)
     lineProgram.compile_and_link()
 
     # create uniforms
     uniformInfos = [
-        ('projection', 'mat4f'),
-        ('view', 'mat4f'),
         ('model', 'mat4f'),
-        ('lightPos', 'vec3f'),
-        ('viewPos', 'vec3f'),
         ('lightColor', 'vec3f'),
         ('objectColor', 'vec3f'),
         ('ambientCoef', 'float'),
@@ -285,16 +393,20 @@ if __name__ == '__main__':
     ]
 
     lineUniformInfos = [
-        ('projection', 'mat4f'),
-        ('view', 'mat4f'),
         ('model', 'mat4f'),
-        ('viewPos', 'vec3f'),
         ('lineWidth', 'float'),
         ('lineColor', 'vec3f')
     ]
 
+    instancedUniformInfos = [x for x in uniformInfos if x[0] != 'model']
+
     uniforms = create_uniform(renderProgram.get_program_id(), uniformInfos)
     lineUniforms = create_uniform(lineProgram.get_program_id(), lineUniformInfos)
+    instancedUniforms = create_uniform(instancedRenderProgram.get_program_id(), instancedUniformInfos)
+
+    # camera and lighting states shared by all programs
+    sceneBlock = GLUniformBlock(sceneBlockName, sceneBlockDtype, 0)
+    sceneBlock.bind_to_programs([renderProgram, lineProgram, instancedRenderProgram])
 
     # change drawing mode
     # glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
@@ -309,92 +421,109 @@ if __name__ == '__main__':
 
         aspect = windowSize[0] / windowSize[1]
 
+        # update the shared uniform block once for all programs
+        sceneBlock.update('projection', camera.get_projection_matrix(aspect, zNear, zFar))
+        sceneBlock.update('view', camera.get_view_matrix())
+        sceneBlock.update('viewPos', camera.get_eye_pos())
+        sceneBlock.update('lightPos', camera.get_eye_pos())
+        sceneBlock.upload()
+
         # draw the actual path first
         lineProgram.use()
-        lineUniforms['projection'].update(camera.get_projection_matrix(aspect, zNear, zFar))
-        lineUniforms['view'].update(camera.get_view_matrix())
         lineUniforms['model'].update(np.identity(4, np.float32))
         lineUniforms['lineWidth'].update(pathLineWidth)
-        lineUniforms['viewPos'].update(camera.get_eye_pos())
         lineUniforms['lineColor'].update(pathColor)
 
         glBindVertexArray(pathVAO)
         glDrawArrays(GL_LINE_STRIP, 0, pathVertexCount)
         glBindVertexArray(0)
 
-        renderProgram.use()
-
-        # update shading related uniforms
-        uniforms['viewPos'].update(camera.get_eye_pos())
-        uniforms['lightPos'].update(camera.get_eye_pos())
-        uniforms['lightColor'].update(lightColor)
-        uniforms['ambientCoef'].update(ambientCoef)
-        uniforms['specularCoef'].update(specularCoef)
-        uniforms['specularP'].update(specularP)
-        uniforms['projection'].update(camera.get_projection_matrix(aspect, zNear, zFar))
-        uniforms['view'].update(camera.get_view_matrix())
-
-
-        # drawing the joints
-        uniforms['objectColor'].update(jointColor)
-        jointScaleMat = scale(jointScale, jointScale, jointScale)
-        jointScaleMatFlip = scale(jointScale, jointScale, -jointScale)
-        glBindVertexArray(sphereVAO)
-
-        # draw the origin (base)
-        basePos = roboticArm.origin.tolist()
-        uniforms['model'].update(translate(*basePos) @ jointScaleMat)
-        glDrawArrays(GL_TRIANGLES, 0, sphereVertexCount)
-        # flip the sphere and render again to make it a full sphere
-        uniforms['model'].update(translate(*basePos) @ jointScaleMatFlip)
-        glDrawArrays(GL_TRIANGLES, 0, sphereVertexCount)
-
         t = frameTicks[frameCounter]
         currentPs = pFunc(t)
         currentYs = yFunc(t)
-        currentSumPs = np.cumsum(currentPs)
-        currentSumYs = np.cumsum(currentYs)
         armEndPos = roboticArm.get_all_arm_positions_args(roboticArm.origin, roboticArm.armLengths, currentPs, currentYs)
 
-        # draw the end points
-        for i in range(roboticArm.numSegments):
-            jointPos = armEndPos[i].tolist()
-            uniforms['model'].update(translate(*jointPos) @ jointScaleMat)
-            glDrawArrays(GL_TRIANGLES, 0, sphereVertexCount)
-            # flip the sphere and render again to make it a full sphere
-            uniforms['model'].update(translate(*jointPos) @ jointScaleMatFlip)
-            glDrawArrays(GL_TRIANGLES, 0, sphereVertexCount)
+        if useInstancing:
+            instancedRenderProgram.use()
+
+            # update shading related uniforms
+            instancedUniforms['lightColor'].update(lightColor)
+            instancedUniforms['ambientCoef'].update(ambientCoef)
+            instancedUniforms['specularCoef'].update(specularCoef)
+            instancedUniforms['specularP'].update(specularP)
+
+            # drawing the joints
+            update_instance_data(jointInstanceVBO, get_joint_model_matrices(roboticArm.origin, armEndPos))
+            instancedUniforms['objectColor'].update(jointColor)
+            glBindVertexArray(sphereVAO)
+            glDrawElementsInstanced(GL_TRIANGLES, sphereIndexCount, GL_UNSIGNED_INT, ctypes.c_void_p(0),
+                                    roboticArm.numSegments + 1)
+            glBindVertexArray(0)
+
+            # draw the cylinders
+            update_instance_data(armInstanceVBO, get_arm_model_matrices(roboticArm.origin, roboticArm.armLengths,
+                                                                        armEndPos, currentPs, currentYs))
+            instancedUniforms['objectColor'].update(cylinderColor)
+            glBindVertexArray(cylinderVAO)
+            glDrawElementsInstanced(GL_TRIANGLES, cylinderIndexCount, GL_UNSIGNED_INT, ctypes.c_void_p(0),
+                                    roboticArm.numSegments)
+            glBindVertexArray(0)
+        else:
+            renderProgram.use()
 
-        glBindVertexArray(0)
+            # update shading related uniforms
+            uniforms['lightColor'].update(lightColor)
+            uniforms['ambientCoef'].update(ambientCoef)
+            uniforms['specularCoef'].update(specularCoef)
+            uniforms['specularP'].update(specularP)
 
-        # draw the cylinders
-        uniforms['objectColor'].update(cylinderColor)
 
-        glBindVertexArray(cylinderVAO)
-        for i in range(roboticArm.numSegments):
-            pitch = currentSumPs[i]
-            yaw = currentSumYs[i]
-            armY = get_spherical_coord(pitch, yaw)
-            armX = get_spherical_coord(pitch - np.pi / 2.0, yaw + np.pi / 2.0)
-            armZ = normalized(np.cross(armX, armY))
-            armMat = np.identity(4, np.float32)
-            armMat[:3, 0] = armX
-            armMat[:3, 1] = armY
-            armMat[:3, 2] = armZ
+            # drawing the joints
+            uniforms['objectColor'].update(jointColor)
+            jointScaleMat = scale(jointScale, jointScale, jointScale)
+            glBindVertexArray(sphereVAO)
 
-            lastPos = roboticArm.origin if i == 0 else armEndPos[i - 1]
-            targetArmLength = roboticArm.armLengths[i] - 2.0 * armOffset
-            newPos = lastPos + armOffset * armY
+            # draw the origin (base)
+            basePos = roboticArm.origin.tolist()
+            uniforms['model'].update(translate(*basePos) @ jointScaleMat)
+            glDrawElements(GL_TRIANGLES, sphereIndexCount, GL_UNSIGNED_INT, ctypes.c_void_p(0))
 
-            positionMat = translate(newPos[0], newPos[1], newPos[2]) @ armMat @ scale(1.0, targetArmLength, 1.0)
+            currentSumPs = np.cumsum(currentPs)
+            currentSumYs = np.cumsum(currentYs)
 
-            uniforms['model'].update(positionMat @ scale(armScale, 1.0, armScale))
-            glDrawArrays(GL_TRIANGLES, 0, cylinderVertexCount)
-            uniforms['model'].update(positionMat @ scale(armScale, 1.0, -armScale))
-            glDrawArrays(GL_TRIANGLES, 0, cylinderVertexCount)
+            # draw the end points
+            for i in range(roboticArm.numSegments):
+                jointPos = armEndPos[i].tolist()
+                uniforms['model'].update(translate(*jointPos) @ jointScaleMat)
+                glDrawElements(GL_TRIANGLES, sphereIndexCount, GL_UNSIGNED_INT, ctypes.c_void_p(0))
 
-        glBindVertexArray(0)
+            glBindVertexArray(0)
+
+            # draw the cylinders
+            uniforms['objectColor'].update(cylinderColor)
+
+            glBindVertexArray(cylinderVAO)
+            for i in range(roboticArm.numSegments):
+                pitch = currentSumPs[i]
+                yaw = currentSumYs[i]
+                armY = get_spherical_coord(pitch, yaw)
+                armX = get_spherical_coord(pitch - np.pi / 2.0, yaw + np.pi / 2.0)
+                armZ = normalized(np.cross(armX, armY))
+                armMat = np.identity(4, np.float32)
+                armMat[:3, 0] = armX
+                armMat[:3, 1] = armY
+                armMat[:3, 2] = armZ
+
+                lastPos = roboticArm.origin if i == 0 else armEndPos[i - 1]
+                targetArmLength = roboticArm.armLengths[i] - 2.0 * armOffset
+                newPos = lastPos + armOffset * armY
+
+                positionMat = translate(newPos[0], newPos[1], newPos[2]) @ armMat @ scale(1.0, targetArmLength, 1.0)
+
+                uniforms['model'].update(positionMat @ scale(armScale, 1.0, armScale))
+                glDrawElements(GL_TRIANGLES, cylinderIndexCount, GL_UNSIGNED_INT, ctypes.c_void_p(0))
 
+            glBindVertexArray(0)
 
         # respond key press
         keyboard_respond_func()
@@ -409,8 +538,14 @@ if __name__ == '__main__':
     glDeleteVertexArrays(3, [sphereVAO, cylinderVAO, pathVAO])
     # clean up VBO
     sphereDataVBO.delete()
+    sphereEBO.delete()
     cylinderDataVBO.delete()
+    cylinderEBO.delete()
     pathVBO.delete()
+    jointInstanceVBO.delete()
+    armInstanceVBO.delete()
+    # clean up uniform block
+    sceneBlock.delete()
     # clean up program
     renderProgram.delete()
 
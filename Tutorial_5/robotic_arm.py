@@ -1,8 +1,28 @@
 import numpy as np
 
+
+# diagnostics of RoboticArm.solve_position
+class IKDiagnostics:
+
+    def __init__(self, converged, numIterations, error, damping):
+        self.converged = converged
+        self.numIterations = numIterations
+        # distance between the end position and the target
+        self.error = error
+        # the damping of the last iteration
+        self.damping = damping
+
+    def __str__(self):
+        return 'converged: {}, iterations: {}, error: {:.3g}, damping: {:.3g}'.format(
+            self.converged, self.numIterations, self.error, self.damping)
+
+
 class RoboticArm:
 
-    def __init__(self, armLengths):
+    # jacobianMode: 'analytic' computes the derivatives in closed form,
+    # 'numerical' uses central differences and is kept for verification
+    def __init__(self, armLengths, jacobianMode='analytic'):
+        assert jacobianMode in ('analytic', 'numerical')
         # always assume the origin is (0, 0, 0)
         self.origin = np.zeros(3, np.float)
 
@@ -20,6 +40,7 @@ class RoboticArm:
 
         # the epsilon used during numerical differentiation
         self.diffEps = 1.0e-3
+        self.jacobianMode = jacobianMode
 
 
     def get_arm_position(self):
@@ -69,45 +90,79 @@ class RoboticArm:
 
         return result
 
-    # return new ps, ys if successful
-    def solve_new_position(self, newPos):
-        newPos = np.asarray(newPos, np.float)
+    # 3 x 2n matrix of the derivatives of the end position with respect to (ps, ys)
+    def get_jacobian(self):
+        if self.jacobianMode == 'numerical':
+            return self.get_jacobian_numerical_args(self.origin, self.armLengths, self.ps, self.ys, self.diffEps)
+        return self.get_jacobian_args(self.armLengths, self.ps, self.ys)
 
-        # check the validity of the newPos
-        maxRadius = np.sum(self.armLengths)
-        newPosDist = np.linalg.norm(newPos - self.origin)
-        if newPosDist > maxRadius:
-            raise RuntimeError('new position is not reachable')
+    @staticmethod
+    def get_jacobian_args(armLengths, ps, ys):
+        # segment k depends on every angle i <= k, so the derivative with respect to angle i
+        # is the sum of the derivatives of the segments from i to the end
+        sumPs = np.cumsum(ps)
+        sumYs = np.cumsum(ys)
+
+        cosPs = np.cos(sumPs)
+        sinPs = np.sin(sumPs)
+        sinYs = np.sin(sumYs)
+        cosYs = np.cos(sumYs)
+
+        dLocationsDPs = np.stack([-armLengths * sinPs * cosYs, armLengths * cosPs, -armLengths * sinPs * sinYs], axis=0)
+        dLocationsDYs = np.stack([-armLengths * cosPs * sinYs, np.zeros_like(armLengths), armLengths * cosPs * cosYs],
+                                 axis=0)
+
+        # reversed cumulative sums
+        dPs = np.cumsum(dLocationsDPs[:, ::-1], axis=1)[:, ::-1]
+        dYs = np.cumsum(dLocationsDYs[:, ::-1], axis=1)[:, ::-1]
+
+        return np.concatenate([dPs, dYs], axis=1)
+
+    @staticmethod
+    def get_jacobian_numerical_args(origin, armLengths, ps, ys, diffEps):
+        numSegments = ps.size
 
         # concatenate ps and ys to form a big parameter vector
         # and compute the partial derivatives
         paramDeltaDiff = []
         paramDeltaSum = []
 
-        for i in range(self.numSegments):
-            psm = np.copy(self.ps)
-            psp = np.copy(self.ps)
-            psm[i] -= self.diffEps
-            psp[i] += self.diffEps
-            paramDeltaSum.append((psp, self.ys))
-            paramDeltaDiff.append((psm, self.ys))
-
-        for i in range(self.numSegments):
-            ysm = np.copy(self.ys)
-            ysp = np.copy(self.ys)
-            ysm[i] -= self.diffEps
-            ysp[i] += self.diffEps
-            paramDeltaSum.append((self.ps, ysp))
-            paramDeltaDiff.append((self.ps, ysm))
+        for i in range(numSegments):
+            psm = np.copy(ps)
+            psp = np.copy(ps)
+            psm[i] -= diffEps
+            psp[i] += diffEps
+            paramDeltaSum.append((psp, ys))
+            paramDeltaDiff.append((psm, ys))
+
+        for i in range(numSegments):
+            ysm = np.copy(ys)
+            ysp = np.copy(ys)
+            ysm[i] -= diffEps
+            ysp[i] += diffEps
+            paramDeltaSum.append((ps, ysp))
+            paramDeltaDiff.append((ps, ysm))
 
         derivatives = []
         for i in range(len(paramDeltaSum)):
-            fSum = self.get_arm_position_args(self.origin, self.armLengths, paramDeltaSum[i][0], paramDeltaSum[i][1])
-            fDiff = self.get_arm_position_args(self.origin, self.armLengths, paramDeltaDiff[i][0], paramDeltaDiff[i][1])
-            deriv = (fSum - fDiff) / (2.0 * self.diffEps)
+            fSum = RoboticArm.get_arm_position_args(origin, armLengths, paramDeltaSum[i][0], paramDeltaSum[i][1])
+            fDiff = RoboticArm.get_arm_position_args(origin, armLengths, paramDeltaDiff[i][0], paramDeltaDiff[i][1])
+            deriv = (fSum - fDiff) / (2.0 * diffEps)
             derivatives.append(deriv)
 
-        derivatives = np.concatenate(derivatives).reshape((-1, 3)).transpose()
+        return np.concatenate(derivatives).reshape((-1, 3)).transpose()
+
+    # return new ps, ys if successful
+    def solve_new_position(self, newPos):
+        newPos = np.asarray(newPos, np.float)
+
+        # check the validity of the newPos
+        maxRadius = np.sum(self.armLengths)
+        newPosDist = np.linalg.norm(newPos - self.origin)
+        if newPosDist > maxRadius:
+            raise RuntimeError('new position is not reachable')
+
+        derivatives = self.get_jacobian()
 
         # compute pseudoinverse for the derivatives
         derivInv = np.linalg.pinv(derivatives, rcond=1.0e-4)
@@ -130,4 +185,137 @@ class RoboticArm:
 
         return newPs, newYs, relativeError
 
+    # damped least squares (Levenberg-Marquardt) starting from the current ps, ys
+    # each iteration solves (J J^T + damping^2 I) w = error and steps by J^T w, the damping is decreased after
+    # a step that reduces the error and increased (without moving) after a step that does not
+    # tolerance: distance to newPos at which the solve has converged
+    # pitchLimits, yawLimits: optional (min, max) of the angles, numbers or arrays of numSegments,
+    # the angles are clamped after every step
+    # returns new ps, ys and IKDiagnostics
+    def solve_position(self, newPos, tolerance=1.0e-4, maxIterations=50, initDamping=1.0e-2, maxDamping=1.0e3,
+                       pitchLimits=None, yawLimits=None):
+        newPos = np.asarray(newPos, np.float64)
+
+        # check the validity of the newPos
+        maxRadius = np.sum(self.armLengths)
+        newPosDist = np.linalg.norm(newPos - self.origin)
+        if newPosDist > maxRadius:
+            raise RuntimeError('new position is not reachable')
+
+        ps = self._clamp_angles(self.ps, pitchLimits)
+        ys = self._clamp_angles(self.ys, yawLimits)
+        delta = newPos - self.get_arm_position_args(self.origin, self.armLengths, ps, ys)
+        error = np.linalg.norm(delta)
+        damping = initDamping
+
+        numIterations = 0
+        while error > tolerance and numIterations < maxIterations and damping <= maxDamping:
+            numIterations += 1
+
+            jacobian = self.get_jacobian_args(self.armLengths, ps, ys) if self.jacobianMode == 'analytic' else \
+                self.get_jacobian_numerical_args(self.origin, self.armLengths, ps, ys, self.diffEps)
+            # the 3 x 3 system is cheaper than the 2n x 2n normal equations
+            weights = np.linalg.solve(jacobian @ jacobian.T + damping * damping * np.identity(3), delta)
+            deltaParam = jacobian.T @ weights
+
+            newPs = self._clamp_angles(ps + deltaParam[:self.numSegments], pitchLimits)
+            newYs = self._clamp_angles(ys + deltaParam[self.numSegments:], yawLimits)
+            newDelta = newPos - self.get_arm_position_args(self.origin, self.armLengths, newPs, newYs)
+            newError = np.linalg.norm(newDelta)
+
+            if newError < error:
+                ps, ys, delta, error = newPs, newYs, newDelta, newError
+                damping *= 0.5
+            else:
+                damping *= 4.0
+
+        return ps, ys, IKDiagnostics(error <= tolerance, numIterations, error, damping)
+
+    @staticmethod
+    def _clamp_angles(angles, limits):
+        if limits is None:
+            return angles
+        return np.clip(angles, limits[0], limits[1])
+
+    # the batched versions below work on B arms at once
+    # origins: (B, 3) or (3,), armLengths, ps, ys: (B, n), targets: (B, 3)
 
+    @staticmethod
+    def get_arm_position_batch(origins, armLengths, ps, ys):
+        sumPs = np.cumsum(ps, axis=1)
+        sumYs = np.cumsum(ys, axis=1)
+
+        cosPs = np.cos(sumPs)
+        sinPs = np.sin(sumPs)
+
+        locations = np.stack([armLengths * cosPs * np.cos(sumYs), armLengths * sinPs, armLengths * cosPs * np.sin(sumYs)],
+                             axis=2)
+        return np.sum(locations, axis=1) + origins
+
+    # (B, 3, 2n)
+    @staticmethod
+    def get_jacobian_batch(armLengths, ps, ys):
+        sumPs = np.cumsum(ps, axis=1)
+        sumYs = np.cumsum(ys, axis=1)
+
+        cosPs = np.cos(sumPs)
+        sinPs = np.sin(sumPs)
+        sinYs = np.sin(sumYs)
+        cosYs = np.cos(sumYs)
+
+        dLocationsDPs = np.stack([-armLengths * sinPs * cosYs, armLengths * cosPs, -armLengths * sinPs * sinYs], axis=1)
+        dLocationsDYs = np.stack([-armLengths * cosPs * sinYs, np.zeros_like(armLengths), armLengths * cosPs * cosYs],
+                                 axis=1)
+
+        # reversed cumulative sums, see get_jacobian_args
+        dPs = np.cumsum(dLocationsDPs[:, :, ::-1], axis=2)[:, :, ::-1]
+        dYs = np.cumsum(dLocationsDYs[:, :, ::-1], axis=2)[:, :, ::-1]
+
+        return np.concatenate([dPs, dYs], axis=2)
+
+    # solve_position for B arms, every arm has its own damping and stops when it converges
+    # unreachable targets are not solved and reported as not converged
+    # returns new ps, ys (B, n) and converged, errors (B,)
+    @staticmethod
+    def solve_position_batch(origins, armLengths, ps, ys, targets, tolerance=1.0e-4, maxIterations=50,
+                             initDamping=1.0e-2, maxDamping=1.0e3):
+        armLengths = np.asarray(armLengths, np.float64)
+        ps = np.array(ps, np.float64)
+        ys = np.array(ys, np.float64)
+        targets = np.asarray(targets, np.float64)
+        numSegments = ps.shape[1]
+
+        isReachable = np.linalg.norm(targets - origins, axis=1) <= np.sum(armLengths, axis=1)
+        delta = targets - RoboticArm.get_arm_position_batch(origins, armLengths, ps, ys)
+        errors = np.linalg.norm(delta, axis=1)
+        damping = np.full(ps.shape[0], initDamping)
+
+        for _ in range(maxIterations):
+            active = np.logical_and(isReachable, np.logical_and(errors > tolerance, damping <= maxDamping))
+            if not np.any(active):
+                break
+
+            jacobian = RoboticArm.get_jacobian_batch(armLengths[active], ps[active], ys[active])
+            systems = jacobian @ np.swapaxes(jacobian, 1, 2) + \
+                (damping[active] ** 2)[:, None, None] * np.identity(3)
+            weights = np.linalg.solve(systems, delta[active][:, :, None])
+            deltaParam = (np.swapaxes(jacobian, 1, 2) @ weights)[:, :, 0]
+
+            newPs = ps[active] + deltaParam[:, :numSegments]
+            newYs = ys[active] + deltaParam[:, numSegments:]
+            activeOrigins = origins[active] if np.ndim(origins) == 2 else origins
+            newDelta = targets[active] - RoboticArm.get_arm_position_batch(activeOrigins, armLengths[active],
+                                                                           newPs, newYs)
+            newErrors = np.linalg.norm(newDelta, axis=1)
+
+            # accept the steps that reduce the error
+            isBetter = newErrors < errors[active]
+            accepted = np.flatnonzero(active)[isBetter]
+            ps[accepted] = newPs[isBetter]
+            ys[accepted] = newYs[isBetter]
+            delta[accepted] = newDelta[isBetter]
+            errors[accepted] = newErrors[isBetter]
+            damping[active] *= np.where(isBetter, 0.5, 4.0)
+
+        converged = np.logical_and(isReachable, errors <= tolerance)
+        return ps, ys, converged, errors
@@ -1,11 +1,18 @@
+import numpy as np
+
 vertexShaderSource = r'''
 #version 330 core
 layout (location = 0) in vec3 aPos;
 layout (location = 1) in vec3 aNormal;
 
 uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
+layout (std140) uniform SceneBlock
+{
+    mat4 projection;
+    mat4 view;
+    vec3 viewPos;
+    vec3 lightPos;
+};
 
 out vec3 fragPos;
 out vec3 bNormal;
@@ -18,6 +25,32 @@ void main()
 }
 '''
 
+# same as vertexShaderSource, but the model matrix is a per-instance attribute
+instancedVertexShaderSource = r'''
+#version 330 core
+layout (location = 0) in vec3 aPos;
+layout (location = 1) in vec3 aNormal;
+layout (location = 2) in mat4 aModel;
+
+layout (std140) uniform SceneBlock
+{
+    mat4 projection;
+    mat4 view;
+    vec3 viewPos;
+    vec3 lightPos;
+};
+
+out vec3 fragPos;
+out vec3 bNormal;
+
+void main()
+{
+    fragPos = vec3(aModel * vec4(aPos, 1.0));
+    bNormal = mat3(transpose(inverse(aModel))) * aNormal;
+    gl_Position = projection * view * aModel * vec4(aPos, 1.0);
+}
+'''
+
 fragmentShaderSource = r'''
 #version 330 core
 in vec3 fragPos;
@@ -26,11 +59,16 @@ out vec4 fragColor;
 
 uniform vec3 objectColor;
 uniform vec3 lightColor;
-uniform vec3 viewPos;
-uniform vec3 lightPos;
 uniform float ambientCoef;
 uniform float specularCoef;
 uniform int specularP;
+layout (std140) uniform SceneBlock
+{
+    mat4 projection;
+    mat4 view;
+    vec3 viewPos;
+    vec3 lightPos;
+};
 
 void main()
 {   
@@ -72,10 +110,14 @@ out vec3 fragPos;
 out vec3 gNormal;
 
 uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
-uniform vec3 viewPos;
 uniform float lineWidth;
+layout (std140) uniform SceneBlock
+{
+    mat4 projection;
+    mat4 view;
+    vec3 viewPos;
+    vec3 lightPos;
+};
 
 void main(){
     vec3 p1 = gl_in[0].gl_Position.xyz;
@@ -131,4 +173,13 @@ void main(){
 
     fragColor = vec4(lineColor, 1.0);
 }
-'''
\ No newline at end of file
+'''
+
+# the std140 block shared by the programs above, see GLUniformBlock
+sceneBlockName = 'SceneBlock'
+sceneBlockDtype = np.dtype([
+    ('projection', np.float32, (4, 4)),
+    ('view', np.float32, (4, 4)),
+    ('viewPos', np.float32, 3),
+    ('lightPos', np.float32, 3)
+])
@@ -0,0 +1,107 @@
+import numpy as np
+from Tutorial_6.spring_mass_grid import gridSpringSetting, get_grid_springs, get_initial_positions, \
+    get_default_wind_region, get_triangle_indices, get_vertex_normals, get_spring_force, get_wind_force
+
+
+# batchSize cloths of the same grid and springs simulated together with the explicit solver of SpringMassGrid
+# every cloth has its own stiffness, pointMass, dampingCoef and airCoef
+# the state arrays have a leading batch axis, pos, vlc, acc and normal are B x numRows x numCols x 3
+class BatchedSpringMassGrid:
+
+    # stiffness, pointMass, dampingCoef, airCoef: a number shared by all cloths or one value per cloth
+    # the other parameters are the same as SpringMassGrid
+    def __init__(self, batchSize, numRows, numCols, topLeftPos, gravity, stiffness, initLength, pointMass, dampingCoef,
+                 airCoef, windVelocity=None, windRegion=None, pinnedIndices=None, dtype=np.float64):
+        assert batchSize > 0
+        assert numRows > 2
+        assert numCols > 2
+        # we need to ignore division errors as we need to constantly divide vectors by zero
+        np.seterr(divide='ignore', invalid='ignore')
+
+        self.dtype = np.dtype(dtype)
+        self.batchSize = batchSize
+        self.numRows = numRows
+        self.numCols = numCols
+        self.topLeftPos = np.asarray(topLeftPos, self.dtype)
+        self.gravity = gravity
+        self.initLength = initLength
+        self.stiffness = self._get_batch_param(stiffness)
+        self.pointMass = self._get_batch_param(pointMass)
+        self.dampingCoef = self._get_batch_param(dampingCoef)
+        self.windCoef = self._get_batch_param(airCoef)
+
+        if windVelocity is None:
+            windVelocity = [0.0, 0.0, -1.0]
+        self.windVelocity = np.asarray(windVelocity, self.dtype)
+
+        if windRegion is None:
+            windRegion = get_default_wind_region(numRows, numCols, initLength)
+        self.windRegion = (np.asarray(windRegion[0], self.dtype), np.asarray(windRegion[1], self.dtype))
+
+        shape = (batchSize, numRows, numCols, 3)
+        self.acc = np.zeros(shape, self.dtype)
+        self.vlc = np.zeros(shape, self.dtype)
+
+        # initialize position, the same for every cloth
+        initPos = get_initial_positions(numRows, numCols, topLeftPos, initLength)
+        self.pos = np.array(np.broadcast_to(initPos, shape), self.dtype)
+
+        self.springEdges, self.springRestLengths = get_grid_springs(numRows, numCols, initLength, gridSpringSetting)
+        self.springRestLengths = self.springRestLengths.astype(self.dtype)
+
+        # assume that the top two corners are hung
+        if pinnedIndices is None:
+            pinnedIndices = [0, numCols - 1]
+        self.pinnedIndices = np.asarray(pinnedIndices, np.int64)
+
+        # two triangles per quad, as flat indices into the grid
+        self.triangleIndices = get_triangle_indices(numRows, numCols)
+
+        self.normal = self.compute_normal()
+
+    def _get_batch_param(self, value):
+        return np.array(np.broadcast_to(np.asarray(value, self.dtype), (self.batchSize,)))
+
+    # area-weighted vertex normals
+    def compute_normal(self):
+        vertexNormals = get_vertex_normals(self.pos.reshape((self.batchSize, -1, 3)), self.triangleIndices)
+        return vertexNormals.reshape(self.pos.shape)
+
+    # compute the force each point of each cloth receives at this given time
+    def compute_force(self):
+        force = np.zeros(self.pos.shape, self.dtype)
+
+        # gravity (assume that gravity is along negative y axis)
+        force[:, :, :, 1] -= (self.gravity * self.pointMass)[:, None, None]
+
+        # viscous damping
+        force -= self.dampingCoef[:, None, None, None] * self.vlc
+
+        # compute the internal force of the spring grid
+        springTotal = get_spring_force(self.pos.reshape((self.batchSize, -1, 3)), self.springEdges,
+                                       self.springRestLengths, self.stiffness[:, None, None])
+        force += springTotal.reshape(self.pos.shape)
+
+        # simulate wind in a constant part of the space
+        force += get_wind_force(self.pos, self.normal, self.windVelocity, self.windRegion,
+                                self.windCoef[:, None, None, None])
+
+        # pinned points do not move
+        force.reshape((self.batchSize, -1, 3))[:, self.pinnedIndices] = 0.0
+
+        return force
+
+    def get_new_state(self, dt):
+        newAcc = self.compute_force() / self.pointMass[:, None, None, None]
+        newVlc = self.vlc + dt * newAcc
+        newPos = self.pos + dt * newVlc
+
+        return newAcc, newVlc, newPos
+
+    def get_new_state_and_update(self, dt):
+        newAcc, newVlc, newPos = self.get_new_state(dt)
+        self.acc = newAcc
+        self.vlc = newVlc
+        self.pos = newPos
+        self.normal = self.compute_normal()
+        return np.copy(newAcc), np.copy(newVlc), np.copy(newPos)
@@ -0,0 +1,63 @@
+import numpy as np
+import time
+
+# add last folder into PYTHONPATH
+import sys, os
+
+lastFolder = os.path.split(os.getcwd())[0]
+sys.path.append(lastFolder)
+
+from Tutorial_6.spring_mass_grid import SpringMassGrid
+
+# the same settings as Tutorial_6/main.py
+deltaTime = 0.01
+gridSizes = [14, 28, 56, 112, 200]
+gridDtypes = [np.float64, np.float32]
+minBenchmarkTime = 1.0
+
+# the float32 simulation should stay within maxDrift of the float64 one after driftSteps steps
+driftSteps = 3000
+maxDrift = 1.0e-3
+
+
+def create_grid(size, dtype=np.float64):
+    return SpringMassGrid(size, size, [0, 0, 0], 4.0, 8.0, 0.2, 0.01, 0.05, 0.02, dtype=dtype)
+
+
+# runs simulation steps for at least minTime seconds, returns steps per second
+def measure_steps_per_second(grid, minTime):
+    # warm up
+    grid.get_new_state_and_update(deltaTime)
+
+    numSteps = 0
+    startTime = time.perf_counter()
+    while time.perf_counter() - startTime < minTime:
+        grid.get_new_state_and_update(deltaTime)
+        numSteps += 1
+
+    return numSteps / (time.perf_counter() - startTime)
+
+
+# runs the same grid in float64 and float32, returns the largest position difference
+def measure_float32_drift(size, numSteps):
+    referenceGrid = create_grid(size, np.float64)
+    grid = create_grid(size, np.float32)
+    for _ in range(numSteps):
+        referenceGrid.get_new_state_and_update(deltaTime)
+        grid.get_new_state_and_update(deltaTime)
+
+    return np.max(np.abs(referenceGrid.pos - grid.pos))
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>8} {:>12} {:>16}'.format('grid', 'dtype', 'steps/s', 'points*steps/s'))
+    for size in gridSizes:
+        for dtype in gridDtypes:
+            grid = create_grid(size, dtype)
+            stepsPerSecond = measure_steps_per_second(grid, minBenchmarkTime)
+            print('{:>10} {:>8} {:>12.1f} {:>16.3g}'.format('{}x{}'.format(size, size), np.dtype(dtype).name,
+                                                           stepsPerSecond, stepsPerSecond * size * size))
+
+    drift = measure_float32_drift(gridSizes[0], driftSteps)
+    print('float32 drift after {} steps: {:.3g} ({})'.format(driftSteps, drift, 'ok' if drift < maxDrift else 'FAIL'))
+    assert drift < maxDrift
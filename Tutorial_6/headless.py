@@ -0,0 +1,51 @@
+import numpy as np
+import argparse
+import time
+
+# add last folder into PYTHONPATH
+import sys, os
+
+lastFolder = os.path.split(os.getcwd())[0]
+sys.path.append(lastFolder)
+
+from Tutorial_6.spring_mass_grid import SpringMassGrid
+from Tutorial_6.trajectory import TrajectoryWriter
+
+# runs the cloth simulation of Tutorial_6/main.py without a window and saves the trajectory
+# the trajectory can be played back by setting replayDirectory in Tutorial_6/main.py
+# example: python headless.py trajectory --steps 6000 --save-every 2 --float16
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='headless cloth simulation')
+    parser.add_argument('output', help='output directory of the trajectory')
+    parser.add_argument('--steps', type=int, default=1000, help='number of simulation steps')
+    parser.add_argument('--dt', type=float, default=0.01, help='time step of the simulation')
+    parser.add_argument('--size', type=int, default=14, help='number of rows and columns of the grid')
+    parser.add_argument('--solver', default='explicit', choices=['explicit', 'implicit', 'pbd'])
+    parser.add_argument('--save-every', type=int, default=1, help='save one frame every this many steps')
+    parser.add_argument('--chunk-size', type=int, default=256, help='number of frames in one chunk file')
+    parser.add_argument('--float16', action='store_true', help='store the frames as float16')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    initLength = 0.2
+    grid = SpringMassGrid(args.size, args.size, [0, 0, 0], 4.0, 8.0, initLength, 0.01, 0.05, 0.02,
+                          solver=args.solver, dtype=np.float32)
+    writer = TrajectoryWriter(args.output, args.size, args.size, args.dt * args.save_every, args.chunk_size,
+                              np.float16 if args.float16 else np.float32, {'initLength': initLength})
+
+    startTime = time.perf_counter()
+    writer.append(grid.get_vertex_data())
+    for step in range(1, args.steps + 1):
+        grid.get_new_state_and_update(args.dt)
+        if step % args.save_every == 0:
+            writer.append(grid.get_vertex_data())
+    writer.close()
+
+    elapsed = time.perf_counter() - startTime
+    print('{} steps in {:.2f}s ({:.1f} steps/s), {} frames written to {}'.format(
+        args.steps, elapsed, args.steps / elapsed, writer.numFrames, args.output))
@@ -42,36 +42,34 @@ camera = FPSCamera()
 camera.eyePos = np.array((0.0, 0.0, 5.0), np.float32)
 
 from Tutorial_6.spring_mass_grid import SpringMassGrid
-grid = SpringMassGrid(14, 14, [0, 0, 0], 4.0, 8.0, 0.2, 0.01, 0.05, 0.02)
-# initialize grid array
-gridArray = np.concatenate([grid.pos.squeeze(), grid.compute_normal()], axis=2)
-gridArray = gridArray.flatten().astype(np.float32)
-
-def convert_grid_index(_2dInd):
-    return _2dInd[0] * grid.numCols + _2dInd[1]
-
-# iniitilze element array
-elementArray = []
-for i in range(grid.numRows - 1):
-    for j in range(grid.numCols - 1):
-        tri1Indices = [
-            (i, j),
-            (i + 1, j),
-            (i + 1, j + 1)
-        ]
-        tri1Indices = list(map(convert_grid_index, tri1Indices))
-
-        tri2Indices = [
-            (i, j),
-            (i + 1, j + 1),
-            (i, j + 1)
-        ]
-        tri2Indices =  list(map(convert_grid_index, tri2Indices))
-        elementArray.extend(tri1Indices)
-        elementArray.extend(tri2Indices)
-
-
-elementArray = np.asarray(elementArray, np.uint32)
+from Tutorial_6.trajectory import TrajectoryReader
+
+# play back a trajectory saved by Tutorial_6/headless.py instead of simulating, None to simulate
+replayDirectory = None
+replay = TrajectoryReader(replayDirectory) if replayDirectory is not None else None
+
+# 'explicit' needs a small deltaTime, 'implicit' stays stable with 5-10x larger steps
+# 'pbd' projects the springs as distance constraints with a fixed number of iterations per step
+simulationSolver = 'explicit'
+if replay is None:
+    grid = SpringMassGrid(14, 14, [0, 0, 0], 4.0, 8.0, 0.2, 0.01, 0.05, 0.02, solver=simulationSolver,
+                          dtype=np.float32)
+else:
+    # only used for the mesh and the size of the grid
+    grid = SpringMassGrid(replay.numRows, replay.numCols, [0, 0, 0], 4.0, 8.0, replay.gridInfo['initLength'],
+                          0.01, 0.05, 0.02, dtype=np.float32)
+
+# the simulation runs deltaTime steps to keep up with the wall clock, independent of the frame rate
+from Tutorial_6.simulation_scheduler import SimulationScheduler
+maxSubstepsPerFrame = 10
+# run the simulation on a background thread instead of between the frames
+useSimulationThread = False
+scheduler = SimulationScheduler(grid, deltaTime, maxSubstepsPerFrame)
+# initialize grid array, interleaved float32 positions and normals
+gridArray = grid.get_vertex_data()
+
+# initialize element array
+elementArray = grid.triangleIndices.flatten().astype(np.uint32)
 
 def debug_message_callback(source, msg_type, msg_id, severity, length, raw, user):
     msg = raw[0:length]
@@ -184,8 +182,9 @@ if __name__ == '__main__':
     glfw.set_scroll_callback(theWindow, window_scroll_callback)
 
 
-    gridVBO = VBO(gridArray, usage='GL_DYNAMIC_DRAW')
-    gridVBO.create_buffers()
+    # the grid is streamed to this buffer every frame
+    gridVBO = GLStreamingBuffer(gridArray.nbytes)
+    gridVBO.upload(gridArray)
     gridEBO = VBO(elementArray, usage='GL_STATIC_DRAW', target='GL_ELEMENT_ARRAY_BUFFER')
     gridEBO.create_buffers()
 
@@ -193,7 +192,6 @@ if __name__ == '__main__':
 
     glBindVertexArray(gridVAO)
     gridVBO.bind()
-    gridVBO.copy_data()
     gridEBO.bind()
     gridEBO.copy_data()
     glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * ctypes.sizeof(ctypes.c_float), ctypes.c_void_p(0))
@@ -212,11 +210,7 @@ if __name__ == '__main__':
 
     # create uniforms
     uniformInfos = [
-        ('projection', 'mat4f'),
-        ('view', 'mat4f'),
         ('model', 'mat4f'),
-        ('lightPos', 'vec3f'),
-        ('viewPos', 'vec3f'),
         ('lightColor', 'vec3f'),
         ('objectColor', 'vec3f'),
         ('ambientCoef', 'float'),
@@ -227,7 +221,14 @@ if __name__ == '__main__':
 
     uniforms = create_uniform(renderProgram.get_program_id(), uniformInfos)
 
+    # camera and lighting states shared by both programs
+    sceneBlock = GLUniformBlock(sceneBlockName, sceneBlockDtype, 0)
+    sceneBlock.bind_to_programs([renderProgram, lineProgram])
+
     lastFrameTime = glfw.get_time()
+    replayStartTime = lastFrameTime
+    if useSimulationThread and replay is None:
+        scheduler.start(frameInterval)
 
     # keep rendering until the window should be closed
     while not glfw.window_should_close(theWindow):
@@ -238,17 +239,20 @@ if __name__ == '__main__':
 
         aspect = windowSize[0] / windowSize[1]
 
+        # update the shared uniform block once for all programs
+        sceneBlock.update('projection', camera.get_projection_matrix(aspect, zNear, zFar))
+        sceneBlock.update('view', camera.get_view_matrix())
+        sceneBlock.update('viewPos', camera.get_eye_pos())
+        sceneBlock.update('lightPos', camera.get_eye_pos())
+        sceneBlock.upload()
+
         renderProgram.use()
 
         # update shading related uniforms
-        uniforms['viewPos'].update(camera.get_eye_pos())
-        uniforms['lightPos'].update(camera.get_eye_pos())
         uniforms['lightColor'].update(lightColor)
         uniforms['ambientCoef'].update(ambientCoef)
         uniforms['specularCoef'].update(specularCoef)
         uniforms['specularP'].update(specularP)
-        uniforms['projection'].update(camera.get_projection_matrix(aspect, zNear, zFar))
-        uniforms['view'].update(camera.get_view_matrix())
         uniforms['objectColor'].update(clothColor)
 
 
@@ -257,15 +261,17 @@ if __name__ == '__main__':
         uniforms['model'].update(translate(-rightShift, downShift, 0.0))
 
         # compute new parameters
-        grid.get_new_state_and_update(deltaTime)
-        # compute normal
-        gridArray = np.concatenate([grid.pos.squeeze(), grid.normal], axis=2)
-        gridArray = gridArray.flatten().astype(np.float32)
-        # update buffer
-        gridVBO.set_array(gridArray)
-        gridVBO.bind()
-        gridVBO.copy_data()
-        gridVBO.unbind()
+        nowTime = glfw.get_time()
+        if replay is not None:
+            # the frame is read from the memory map
+            gridVBO.upload(replay.get_frame_at(nowTime - replayStartTime))
+        else:
+            if not useSimulationThread:
+                scheduler.advance(nowTime - lastFrameTime)
+            # update buffer, one copy from the simulation state to the GPU
+            with scheduler.front_vertex_data() as gridArray:
+                gridVBO.upload(gridArray)
+        lastFrameTime = nowTime
 
         glBindVertexArray(gridVAO)
         glDrawElements(GL_TRIANGLES, elementArray.size, GL_UNSIGNED_INT, ctypes.c_void_p(0))
@@ -280,12 +286,16 @@ if __name__ == '__main__':
 
 
 
+    scheduler.stop()
+
     # clean up VAO
     allVAO = [gridVAO]
     glDeleteVertexArrays(len(allVAO), allVAO)
     # clean up VBO
     gridVBO.delete()
     gridEBO.delete()
+    # clean up uniform block
+    sceneBlock.delete()
     # clean up program
     renderProgram.delete()
 
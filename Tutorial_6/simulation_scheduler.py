@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+import numpy as np
+import threading
+import time
+
+
+# runs the simulation with a fixed timestep, independent of the frame rate of the renderer
+# the renderer reads the front buffer, the simulation writes the back buffer, they are swapped after each batch
+# of substeps, so the renderer never sees a half updated state
+# the buffers hold the interleaved float32 vertex data of the grid, so they can be uploaded directly
+class SimulationScheduler:
+
+    # grid: the simulated object, needs get_new_state_and_update(dt) and get_vertex_data()
+    # dt: the fixed timestep of the simulation
+    # maxSubsteps: at most this many substeps are run for one call of advance, the remaining time is dropped
+    # so that a slow frame does not make the next frame even slower
+    # speed: simulated seconds per wall clock second
+    def __init__(self, grid, dt, maxSubsteps=10, speed=1.0):
+        assert dt > 0.0
+        assert maxSubsteps > 0
+        self.grid = grid
+        self.dt = dt
+        self.maxSubsteps = maxSubsteps
+        self.speed = speed
+
+        self.accumulator = 0.0
+        self.numSteps = 0
+        self.numDroppedSteps = 0
+
+        self._front = np.copy(grid.get_vertex_data())
+        self._back = np.empty_like(self._front)
+        self._lock = threading.Lock()
+
+        self._thread = None
+        self._stopEvent = threading.Event()
+
+    def _publish(self):
+        np.copyto(self._back, self.grid.get_vertex_data())
+        with self._lock:
+            self._front, self._back = self._back, self._front
+
+    # runs the substeps for elapsed seconds of wall clock time, returns the number of substeps
+    def advance(self, elapsed):
+        self.accumulator += elapsed * self.speed
+        numSubsteps = min(int(self.accumulator / self.dt), self.maxSubsteps)
+        for _ in range(numSubsteps):
+            self.grid.get_new_state_and_update(self.dt)
+        self.accumulator -= numSubsteps * self.dt
+        self.numSteps += numSubsteps
+
+        if self.accumulator >= self.dt:
+            numDropped = int(self.accumulator / self.dt)
+            self.numDroppedSteps += numDropped
+            self.accumulator -= numDropped * self.dt
+
+        if numSubsteps > 0:
+            self._publish()
+        return numSubsteps
+
+    # the vertex data of the latest published state, the array must not be used after the with block
+    @contextmanager
+    def front_vertex_data(self):
+        with self._lock:
+            yield self._front
+
+    # (pos, normal) of the latest published state, the arrays must not be used after the with block
+    @contextmanager
+    def front_state(self):
+        with self._lock:
+            yield self._front[:, :, :3], self._front[:, :, 3:]
+
+    def _run(self, publishInterval):
+        lastTime = time.perf_counter()
+        while not self._stopEvent.is_set():
+            nowTime = time.perf_counter()
+            numSubsteps = self.advance(nowTime - lastTime)
+            lastTime = nowTime
+            if numSubsteps == 0:
+                # wait until at least one substep is due
+                self._stopEvent.wait(min(publishInterval, (self.dt - self.accumulator) / self.speed))
+
+    # runs the simulation on a background thread, the renderer only reads front_state
+    # numpy releases the GIL in most array operations, so the simulation overlaps with the GL calls
+    # publishInterval: the longest wait of the thread, usually the frame interval of the renderer
+    def start(self, publishInterval):
+        assert self._thread is None
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, args=(publishInterval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopEvent.set()
+        self._thread.join()
+        self._thread = None
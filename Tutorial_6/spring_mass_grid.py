@@ -1,14 +1,190 @@
 import numpy as np
 
 
+# (row, col) offsets of the neighbors connected to each point of the grid
+gridSpringSetting = [
+    (1, 0), # structural
+    (0, 1), # structural
+    (-1, 0), # structural
+    (0, -1), # structural
+    (-1, -1), # shear
+    (-1, 1), # shear
+    (1, -1), #shear
+    (1, 1), #shear
+    (0, 2), #bend
+    (0, -2), # bend
+    (2, 0), # bend
+    (-2, 0)
+]
+
+
+# numRows x numCols x 3 positions of the grid before it moves
+def get_initial_positions(numRows, numCols, topLeftPos, initLength):
+    rows, cols = np.mgrid[0:numRows, 0:numCols]
+    offsets = np.stack([initLength * cols, -initLength * rows, np.zeros(rows.shape)], axis=2)
+    return np.asarray(topLeftPos, np.float64) + offsets
+
+
+# the lower right quarter of the grid in its initial state, as (minCorner, maxCorner)
+def get_default_wind_region(numRows, numCols, initLength):
+    halfX = (numCols // 2) * initLength
+    halfY = -(numRows // 2) * initLength
+    return [halfX, -np.inf, -np.inf], [np.inf, halfY, np.inf]
+
+
+# two triangles per quad, as flat indices into the grid
+def get_triangle_indices(numRows, numCols):
+    flatIndices = np.arange(numRows * numCols).reshape((numRows, numCols))
+    topLeft = flatIndices[:-1, :-1]
+    topRight = flatIndices[:-1, 1:]
+    bottomLeft = flatIndices[1:, :-1]
+    bottomRight = flatIndices[1:, 1:]
+
+    tri1Indices = np.stack([topLeft, bottomLeft, bottomRight], axis=2)
+    tri2Indices = np.stack([topLeft, bottomRight, topRight], axis=2)
+
+    return np.stack([tri1Indices, tri2Indices], axis=2).reshape((-1, 3))
+
+
+# springSetting: (row, col) offsets of the neighbors connected to each point
+# the springs of the opposite offsets are the same, so each spring is only returned once
+# returns (springEdges, springRestLengths): E x 2 flat point indices and the rest lengths
+def get_grid_springs(numRows, numCols, initLength, springSetting):
+    flatIndices = np.arange(numRows * numCols).reshape((numRows, numCols))
+
+    offsets = set()
+    for offset in springSetting:
+        if (-offset[0], -offset[1]) not in offsets:
+            offsets.add(tuple(offset))
+
+    allEdges = []
+    allRestLengths = []
+    for rowOffset, colOffset in sorted(offsets):
+        rowRange = slice(max(0, -rowOffset), numRows - max(0, rowOffset))
+        colRange = slice(max(0, -colOffset), numCols - max(0, colOffset))
+        otherRowRange = slice(rowRange.start + rowOffset, rowRange.stop + rowOffset)
+        otherColRange = slice(colRange.start + colOffset, colRange.stop + colOffset)
+
+        edges = np.stack([flatIndices[rowRange, colRange].flatten(),
+                          flatIndices[otherRowRange, otherColRange].flatten()], axis=1)
+        allEdges.append(edges)
+        allRestLengths.append(np.full(edges.shape[0], np.hypot(rowOffset, colOffset) * initLength))
+
+    return np.concatenate(allEdges, axis=0), np.concatenate(allRestLengths)
+
+
+# splits the springs into groups in which no two springs share a point, so that the springs of a group
+# can be solved at the same time without conflicts
+# returns a list of arrays of spring indices
+def get_spring_colors(springEdges, numPoints):
+    springColors = []
+    remaining = np.arange(springEdges.shape[0])
+
+    while remaining.size > 0:
+        colorSprings = []
+        candidates = remaining
+        while candidates.size > 0:
+            # a spring is taken if it is the first candidate for both of its points
+            edges = springEdges[candidates]
+            order = np.arange(candidates.size)
+            firstSpring = np.full(numPoints, candidates.size, np.int64)
+            np.minimum.at(firstSpring, edges[:, 0], order)
+            np.minimum.at(firstSpring, edges[:, 1], order)
+            isTaken = np.logical_and(firstSpring[edges[:, 0]] == order, firstSpring[edges[:, 1]] == order)
+            colorSprings.append(candidates[isTaken])
+
+            # the other springs touching the taken points must wait for the next color
+            usedPoints = np.zeros(numPoints, np.bool_)
+            usedPoints[edges[isTaken].flatten()] = True
+            isBlocked = np.logical_or(usedPoints[edges[:, 0]], usedPoints[edges[:, 1]])
+            candidates = candidates[np.logical_not(isBlocked)]
+
+        colorSprings = np.concatenate(colorSprings)
+        springColors.append(colorSprings)
+        remaining = np.setdiff1d(remaining, colorSprings, assume_unique=True)
+
+    return springColors
+
+
+# adds values (... x N x 3) to the rows of indices (N) in an array of ... x numPoints x 3
+# the leading axes are batches that are added separately, the result has the dtype of values
+def scatter_add(indices, values, numPoints):
+    batchShape = values.shape[:-2]
+    numBatches = int(np.prod(batchShape))
+    flatIndices = (np.arange(numBatches)[:, None] * numPoints + indices[None, :]).flatten()
+    flatValues = values.reshape((-1, values.shape[-1]))
+    result = np.stack(
+        [np.bincount(flatIndices, weights=flatValues[:, i], minlength=numBatches * numPoints)
+         for i in range(values.shape[-1])],
+        axis=1
+    )
+    return result.astype(values.dtype, copy=False).reshape(batchShape + (numPoints, values.shape[-1]))
+
+
+# area-weighted vertex normals of pos (... x numPoints x 3)
+def get_vertex_normals(pos, triangleIndices):
+    p1 = pos[..., triangleIndices[:, 0], :]
+    p2 = pos[..., triangleIndices[:, 1], :]
+    p3 = pos[..., triangleIndices[:, 2], :]
+
+    # the length of the cross product is twice the area of the triangle
+    faceNormals = np.cross(p2 - p1, p3 - p1)
+
+    # add the face normals to the vertices of each face
+    vertexNormals = scatter_add(triangleIndices.flatten(), np.repeat(faceNormals, 3, axis=-2), pos.shape[-2])
+
+    norms = np.linalg.norm(vertexNormals, axis=-1)
+    validNorms = norms > 1.0e-12
+    vertexNormals[validNorms] /= norms[validNorms, None]
+    vertexNormals[np.logical_not(validNorms)] = 0.0
+
+    return vertexNormals
+
+
+# the force each point of pos (... x numPoints x 3) receives from the springs
+# stiffness: a number or an array that broadcasts with the leading axes, e.g. B x 1 x 1
+def get_spring_force(pos, springEdges, springRestLengths, stiffness):
+    # the force on the first point of a spring is opposite to the force on the second point
+    springVec = pos[..., springEdges[:, 1], :] - pos[..., springEdges[:, 0], :]
+    springLength = np.linalg.norm(springVec, axis=-1)
+    springNormalVec = np.nan_to_num(springVec / springLength[..., None], 0.0)
+    springForce = (springVec - springRestLengths[:, None] * springNormalVec) * stiffness
+    return scatter_add(springEdges.T.flatten(), np.concatenate([springForce, -springForce], axis=-2), pos.shape[-2])
+
+
+# the wind force on the points of pos (... x 3) with the given normals inside windRegion
+# windCoef: a number or an array that broadcasts with pos, e.g. B x 1 x 1 x 1
+def get_wind_force(pos, normal, windVelocity, windRegion, windCoef):
+    isAffected = np.logical_and(np.all(pos >= windRegion[0], axis=-1), np.all(pos <= windRegion[1], axis=-1))
+
+    windDiff = windVelocity - normal
+    windDot = np.einsum('...k,...k->...', windDiff, normal)
+    return windCoef * (windDot * isAffected)[..., None] * normal
+
+
 class SpringMassGrid:
 
-    def __init__(self, numRows, numCols, topLeftPos, gravity, stiffness, initLength, pointMass, dampingCoef, airCoef):
+    # windVelocity: the velocity of the wind, [0, 0, -1] by default
+    # windRegion: (minCorner, maxCorner) of the axis-aligned box where the wind blows, by default
+    # the lower right quarter of the grid in its initial state
+    # springEdges: E x 2 flat point indices of the springs, the springs of the grid (springSetting) by default
+    # springRestLengths: rest lengths of springEdges, the initial distances by default
+    # pinnedIndices: flat indices of the points that never move, the top two corners by default
+    # solver: 'explicit' for symplectic Euler, 'implicit' for backward Euler which is stable with larger dt,
+    # 'pbd' for position based dynamics (XPBD) with distance constraints
+    # cgIterations, cgTolerance: limits of the conjugate gradient solve of the implicit solver
+    # pbdIterations: constraint iterations per step of the pbd solver
+    # dtype: float type of the state, np.float32 halves the memory traffic of the simulation
+    def __init__(self, numRows, numCols, topLeftPos, gravity, stiffness, initLength, pointMass, dampingCoef, airCoef,
+                 windVelocity=None, windRegion=None, springEdges=None, springRestLengths=None, pinnedIndices=None,
+                 solver='explicit', cgIterations=50, cgTolerance=1.0e-6, pbdIterations=10, dtype=np.float64):
         assert numRows > 2
         assert numCols > 2
+        assert solver in ('explicit', 'implicit', 'pbd')
         # we need to ignore division errors as we need to constantly divide vectors by zero
         np.seterr(divide='ignore', invalid='ignore')
 
+        self.dtype = np.dtype(dtype)
         self.numRows = numRows
         self.numCols = numCols
         self.topLeftPos = np.asarray(topLeftPos, np.float)
@@ -18,186 +194,197 @@ class SpringMassGrid:
         self.pointMass = pointMass
         self.dampingCoef = dampingCoef
         self.windCoef = airCoef
+        self.solver = solver
+        self.cgIterations = cgIterations
+        self.cgTolerance = cgTolerance
+        self.pbdIterations = pbdIterations
 
-        self.acc = np.zeros((numRows, numCols, 3), np.float)
-        self.pos = np.zeros((numRows, numCols, 1, 3), np.float) # pos needs a different shape for broadcasting
-        self.vlc = np.zeros((numRows, numCols, 3), np.float)
+        if windVelocity is None:
+            windVelocity = [0.0, 0.0, -1.0]
+        self.windVelocity = np.asarray(windVelocity, self.dtype)
 
-        # initialize position
-        for i in range(numRows):
-            for j in range(numCols):
-                self.pos[i][j][0] = topLeftPos + np.asarray([0.0, -initLength * i, 0.0], np.float) +\
-                                        np.asarray([initLength * j, 0.0, 0.0])
+        if windRegion is None:
+            windRegion = get_default_wind_region(numRows, numCols, initLength)
+        self.windRegion = (np.asarray(windRegion[0], self.dtype), np.asarray(windRegion[1], self.dtype))
 
-        # the springs
+        self.acc = np.zeros((numRows, numCols, 3), self.dtype)
+        self.vlc = np.zeros((numRows, numCols, 3), self.dtype)
 
-        self.springSetting = [
-            (1, 0), # structural
-            (0, 1), # structural
-            (-1, 0), # structural
-            (0, -1), # structural
-            (-1, -1), # shear
-            (-1, 1), # shear
-            (1, -1), #shear
-            (1, 1), #shear
-            (0, 2), #bend
-            (0, -2), # bend
-            (2, 0), # bend
-            (-2, 0)
-        ]
-
-        # the element indices for springs
-        self.springIndices = np.empty((numRows, numCols), dtype=np.object)
-        for i in range(numCols):
-            for j in range(numRows):
-                allIndices = [(x[0] + i, x[1] + j) for x in self.springSetting]
-                self.springIndices[i][j] = self._check_and_fill_indices(allIndices, (i, j), 6)
-
-        self.springIndices = self._get_flat_indices(self.springIndices)
-
-        # the initial lengths of each spring
-        self.springInitLengths = np.linalg.norm(np.asarray(self.springSetting, np.float) * self.initLength, axis = 1)
+        # initialize position, pos needs a different shape for broadcasting
+        self.pos = get_initial_positions(numRows, numCols, topLeftPos, initLength)[:, :, None, :].astype(self.dtype)
 
-        self.normal = self.compute_normal()
+        # the springs
+        self.springSetting = list(gridSpringSetting)
+
+        # every spring is stored once as a pair of flat point indices with its rest length
+        if springEdges is None:
+            springEdges, springRestLengths = get_grid_springs(numRows, numCols, initLength, self.springSetting)
+        elif springRestLengths is None:
+            flatPos = self.pos.reshape((-1, 3))
+            springEdges = np.asarray(springEdges)
+            springRestLengths = np.linalg.norm(flatPos[springEdges[:, 1]] - flatPos[springEdges[:, 0]], axis=1)
+        self.springEdges = np.asarray(springEdges, np.int64)
+        self.springRestLengths = np.asarray(springRestLengths, self.dtype)
+        # the springs of each color are solved together by the pbd solver
+        self.springColors = get_spring_colors(self.springEdges, numRows * numCols) if solver == 'pbd' else None
 
-    def _is_index_valid(self, index):
-        if index[0] >= 0 and index[0] < self.numRows and index[1] >= 0 and index[1] < self.numCols:
-            return True
-        return False
-
-    def _check_and_fill_indices(self, lst, nowIndex, targetLength):
-        validIndices = []
-        for i in range(len(lst)):
-            if self._is_index_valid(lst[i]):
-                validIndices.append(lst[i])
-            else:
-                validIndices.append(nowIndex)
-        validIndices = np.asarray(validIndices)
-        result = [validIndices[:, 0], validIndices[:, 1], np.zeros(validIndices.shape[0], np.int)]
-        return result
-
-    def _get_flat_indices(self, indices):
-        indices = np.asarray(indices)
-        indicesFlat = indices.flatten()
-        allX = []
-        allY = []
-        for i in range(indicesFlat.shape[0]):
-            allX.append(indicesFlat[i][0])
-            allY.append(indicesFlat[i][1])
-        allX = np.concatenate(allX)
-        allY = np.concatenate(allY)
-        return (allX, allY)
-
-    def _extract_points_by_indices(self, points, indices):
-        result = self.pos[indices]
-        result = result.reshape((points.shape[0], points.shape[1], -1, 3))
-        return result
-
-    def _compute_tri_normal(self, p1, p2, p3):
-        vec1 = p2 - p1
-        vec2 = p3 - p1
-        normal = np.cross(vec1, vec2)
-        norm = np.linalg.norm(normal)
-        if norm < 1.0e-3:
-            return np.zeros(3, np.float)
-        else:
-            return normal / norm
+        # assume that the top two corners are hung
+        if pinnedIndices is None:
+            pinnedIndices = [0, numCols - 1]
+        self.pinnedIndices = np.asarray(pinnedIndices, np.int64)
+        # pinned points have infinite mass
+        self.invMass = np.full(numRows * numCols, 1.0 / pointMass, self.dtype)
+        self.invMass[self.pinnedIndices] = 0.0
 
-    def compute_normal(self):
-        normalArray = [[[] for _ in range(self.numCols)] for _ in range(self.numRows)]
+        # two triangles per quad, as flat indices into the grid
+        self.triangleIndices = get_triangle_indices(numRows, numCols)
 
-        def compute_and_update(lstOfIndices):
-            normal = self._compute_tri_normal(
-                *[self.pos[p] for p in lstOfIndices]
-            )
-            for p in lstOfIndices:
-                normalArray[p[0]][p[1]].append(normal)
+        self.normal = self.compute_normal()
 
-        for i in range(self.numRows - 1):
-            for j in range(self.numCols - 1):
+        # interleaved float32 position and normal of each point for rendering, filled by get_vertex_data
+        self.vertexData = np.zeros((numRows, numCols, 6), np.float32)
 
-                tri1Indices = [
-                    (i, j),
-                    (i + 1, j),
-                    (i + 1, j + 1)
-                ]
+    # area-weighted vertex normals
+    def compute_normal(self):
+        vertexNormals = get_vertex_normals(self.pos.reshape((-1, 3)), self.triangleIndices)
+        return vertexNormals.reshape((self.numRows, self.numCols, 3))
 
-                compute_and_update(tri1Indices)
+    # the force each point receives from the springs
+    def compute_spring_force(self):
+        springTotal = get_spring_force(self.pos.reshape((-1, 3)), self.springEdges, self.springRestLengths,
+                                       self.stiffness)
+        return springTotal.reshape((self.numRows, self.numCols, 3))
 
-                tri2Indices = [
-                    (i, j),
-                    (i + 1, j + 1),
-                    (i, j + 1)
-                ]
+    # the force each point receives from everything except the springs
+    def compute_external_force(self):
 
-                compute_and_update(tri2Indices)
+        force = np.zeros((self.numRows, self.numCols, 3), self.dtype)
 
-        result = np.zeros((self.numRows, self.numCols, 3), np.float)
+        # gravity (assume that gravity is along negative y axis)
+        force[:, :] += np.asarray([0.0, -self.gravity * self.pointMass, 0.0], self.dtype)
 
-        # average the surface normals
-        for i in range(self.numRows):
-            for j in range(self.numCols):
-                mean = np.mean(normalArray[i][j], axis=0)
-                norm = np.linalg.norm(mean)
-                if norm < 1.0e-3:
-                    mean = np.zeros(3, np.float)
-                else:
-                    mean /= norm
-                result[i, j, :] = mean
+        # viscous damping
+        force[:, :] += -self.dampingCoef * self.vlc
 
+        # simulate wind in a constant part of the space
+        force[:, :] += get_wind_force(self.pos[:, :, 0, :], self.normal, self.windVelocity, self.windRegion,
+                                      self.windCoef)
 
-        return result
+        return force
 
     # compute the force each point receives at this given time
     def compute_force(self):
+        force = self.compute_external_force() + self.compute_spring_force()
 
-        force = np.zeros((self.numRows, self.numCols, 3), np.float)
-
-        # gravity (assume that gravity is along negative y axis)
-        force[:, :] += np.asarray([0.0, -self.gravity * self.pointMass, 0.0], np.float)
-
-        # viscous damping
-        force[:, :] += -self.dampingCoef * self.vlc
-
-        # compute the internal force of the spring grid
-        springLink = self._extract_points_by_indices(self.pos, self.springIndices)
-        springVec = springLink - self.pos
-        springLength = np.linalg.norm(springVec, axis=3) #
-        springNormalVec = np.nan_to_num(springVec / springLength[:, :, :, None], 0.0)
-        springDelta = (springVec - self.springInitLengths[:, None] * springNormalVec) * self.stiffness
-        springTotal = np.sum(springDelta, axis=2)
-        force += springTotal
-
-        # simulate wind at a constant part of the space
-        halfCol = self.numCols // 2
-        halfX = halfCol * self.initLength
-        posX = self.pos[:, :, 0, 0]
-        halfRow = self.numRows // 2
-        halfY = -halfRow * self.initLength
-        posY = self.pos[:, :, 0, 1]
-        notAffectedPos = np.where(np.bitwise_or(posX < halfX, posY > halfY))
-
-        windSpeed = np.asarray([0, 0, -1], np.float)
-        windDiff = windSpeed - self.normal
-        windDot = np.zeros((self.numRows, self.numCols, 1), np.float)
-        for i in range(self.numRows):
-            for j in range(self.numCols):
-                windDot[i, j, 0] = windDiff[i, j, :] @ self.normal[i, j, :]
-        windForce = self.windCoef * windDot *  self.normal
-
-        # cancel wind force for those parts that are not affected
-        windForce[(notAffectedPos[0], notAffectedPos[1], ...)] = [0, 0, 0]
-        force[:, :] += windForce
-
-        # assume that the top two corners are hung
-        force[0, 0, :] = [0, 0, 0]
-        force[0, self.numCols - 1, :] = [0, 0, 0]
+        # pinned points do not move
+        force.reshape((-1, 3))[self.pinnedIndices] = 0.0
 
         return force
 
+    # per spring 3 x 3 blocks of the derivative of the spring force with respect to the positions
+    # (1 - L / l) is clamped at zero so that the system stays positive definite when springs are compressed
+    def _get_spring_jacobians(self):
+        pos = self.pos.reshape((-1, 3))
+        springVec = pos[self.springEdges[:, 1]] - pos[self.springEdges[:, 0]]
+        springLength = np.linalg.norm(springVec, axis=1)
+        springNormalVec = np.nan_to_num(springVec / springLength[:, None], 0.0)
+
+        outer = springNormalVec[:, :, None] * springNormalVec[:, None, :]
+        stretch = np.maximum(np.nan_to_num(1.0 - self.springRestLengths / springLength, 0.0), 0.0)
+        return self.stiffness * (outer + stretch[:, None, None] * (np.eye(3, dtype=self.dtype) - outer))
+
+    # computes (df/dx) y, where df/dx is assembled from the per spring blocks
+    def _multiply_spring_jacobian(self, jacobians, y):
+        springDelta = np.einsum('eij,ej->ei', jacobians, y[self.springEdges[:, 1]] - y[self.springEdges[:, 0]])
+        return scatter_add(self.springEdges.T.flatten(), np.concatenate([springDelta, -springDelta], axis=0),
+                           self.numRows * self.numCols)
+
+    # backward Euler (Baraff and Witkin), solves
+    # (M - dt * df/dv - dt^2 * df/dx) dv = dt * (f + dt * df/dx v)
+    # with matrix free conjugate gradient, df/dv = -dampingCoef * I and the wind is treated explicitly
+    def _solve_implicit_velocity_change(self, dt):
+        jacobians = self._get_spring_jacobians()
+        freeMask = (self.invMass > 0.0)[:, None]
+        diagCoef = self.pointMass + dt * self.dampingCoef
+
+        vlc = self.vlc.reshape((-1, 3))
+        force = self.compute_force().reshape((-1, 3))
+
+        def multiply_system(y):
+            return (diagCoef * y - dt * dt * self._multiply_spring_jacobian(jacobians, y)) * freeMask
+
+        # Jacobi preconditioner, the diagonal blocks of df/dx are -(sum of the blocks of the connected springs)
+        springDiag = np.diagonal(jacobians, axis1=1, axis2=2)
+        preconditioner = diagCoef + dt * dt * scatter_add(self.springEdges.T.flatten(),
+                                                          np.concatenate([springDiag, springDiag], axis=0),
+                                                          self.numRows * self.numCols)
+
+        rhs = dt * (force + dt * self._multiply_spring_jacobian(jacobians, vlc)) * freeMask
+        dv = np.zeros_like(rhs)
+        residual = rhs.copy()
+        z = residual / preconditioner
+        direction = z.copy()
+        rz = np.sum(residual * z)
+        threshold = self.cgTolerance ** 2 * max(np.sum(rhs * rhs), 1.0e-30)
+
+        for _ in range(self.cgIterations):
+            if np.sum(residual * residual) <= threshold:
+                break
+            q = multiply_system(direction)
+            alpha = rz / np.sum(direction * q)
+            dv += alpha * direction
+            residual -= alpha * q
+            z = residual / preconditioner
+            newRz = np.sum(residual * z)
+            direction = z + (newRz / rz) * direction
+            rz = newRz
+
+        return dv.reshape((self.numRows, self.numCols, 3))
+
+    # XPBD: moves the points with the external force, then projects the predicted positions onto the
+    # distance constraints of the springs with compliance 1 / stiffness
+    # the springs of one color share no points, so each color is a vectorized Gauss-Seidel update
+    def _solve_pbd_positions(self, dt):
+        invMass = self.invMass[:, None]
+        pos = self.pos.reshape((-1, 3))
+        vlc = self.vlc.reshape((-1, 3)) + dt * self.compute_external_force().reshape((-1, 3)) * invMass
+        newPos = pos + dt * vlc
+
+        alphaTilde = 1.0 / (self.stiffness * dt * dt)
+        lagrangeMultipliers = np.zeros(self.springEdges.shape[0], self.dtype)
+
+        for _ in range(self.pbdIterations):
+            for colorSprings in self.springColors:
+                e0 = self.springEdges[colorSprings, 0]
+                e1 = self.springEdges[colorSprings, 1]
+                springVec = newPos[e1] - newPos[e0]
+                springLength = np.linalg.norm(springVec, axis=1)
+                springNormalVec = np.nan_to_num(springVec / springLength[:, None], 0.0)
+
+                constraint = springLength - self.springRestLengths[colorSprings]
+                weightSum = self.invMass[e0] + self.invMass[e1] + alphaTilde
+                deltaLambda = (-constraint - alphaTilde * lagrangeMultipliers[colorSprings]) / weightSum
+                lagrangeMultipliers[colorSprings] += deltaLambda
+
+                correction = deltaLambda[:, None] * springNormalVec
+                newPos[e0] -= invMass[e0] * correction
+                newPos[e1] += invMass[e1] * correction
+
+        return newPos.reshape(self.pos.shape)
+
     def get_new_state(self, dt):
-        newAcc = self.compute_force() / self.pointMass
-        newVlc = self.vlc + dt * newAcc
+        if self.solver == 'pbd':
+            newPos = self._solve_pbd_positions(dt)
+            newVlc = (newPos - self.pos)[:, :, 0, :] / dt
+            newAcc = (newVlc - self.vlc) / dt
+            return newAcc, newVlc, newPos
+        elif self.solver == 'implicit':
+            dv = self._solve_implicit_velocity_change(dt)
+            newAcc = dv / dt
+            newVlc = self.vlc + dv
+        else:
+            newAcc = self.compute_force() / self.pointMass
+            newVlc = self.vlc + dt * newAcc
         newPos = self.pos + dt * newVlc[:, :, None, :]
 
         return newAcc, newVlc, newPos
@@ -208,4 +395,10 @@ class SpringMassGrid:
         self.vlc = newVlc
         self.pos = newPos
         self.normal = self.compute_normal()
-        return np.copy(newAcc), np.copy(newVlc), np.copy(newPos)
\ No newline at end of file
+        return np.copy(newAcc), np.copy(newVlc), np.copy(newPos)
+
+    # writes the current state into vertexData in place and returns it, no array is allocated
+    def get_vertex_data(self):
+        self.vertexData[:, :, :3] = self.pos[:, :, 0, :]
+        self.vertexData[:, :, 3:] = self.normal
+        return self.vertexData
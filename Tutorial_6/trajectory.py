@@ -0,0 +1,90 @@
+import numpy as np
+import json
+import os
+
+manifestName = 'manifest.json'
+chunkNameFormat = 'chunk_{:05d}.npy'
+
+
+# writes frames of interleaved positions and normals (numRows x numCols x 6, the layout of
+# SpringMassGrid.vertexData) into a directory of .npy chunks of chunkSize frames and a json manifest
+# dtype: the stored float type, np.float16 halves the size of float32 at about 1e-3 relative precision
+class TrajectoryWriter:
+
+    # frameInterval: simulated seconds between two frames
+    # gridInfo: extra values saved in the manifest, e.g. initLength for the viewer
+    def __init__(self, directory, numRows, numCols, frameInterval, chunkSize=256, dtype=np.float32, gridInfo=None):
+        assert chunkSize > 0
+        self.directory = directory
+        self.numRows = numRows
+        self.numCols = numCols
+        self.frameInterval = frameInterval
+        self.chunkSize = chunkSize
+        self.dtype = np.dtype(dtype)
+        self.gridInfo = dict() if gridInfo is None else gridInfo
+
+        self.numFrames = 0
+        self.chunkNames = []
+        self._chunk = np.zeros((chunkSize, numRows, numCols, 6), self.dtype)
+        self._numChunkFrames = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _flush(self):
+        if self._numChunkFrames == 0:
+            return
+        chunkName = chunkNameFormat.format(len(self.chunkNames))
+        np.save(os.path.join(self.directory, chunkName), self._chunk[:self._numChunkFrames])
+        self.chunkNames.append(chunkName)
+        self._numChunkFrames = 0
+
+    # vertexData: numRows x numCols x 6
+    def append(self, vertexData):
+        self._chunk[self._numChunkFrames] = vertexData
+        self._numChunkFrames += 1
+        self.numFrames += 1
+        if self._numChunkFrames == self.chunkSize:
+            self._flush()
+
+    # writes the last chunk and the manifest
+    def close(self):
+        self._flush()
+        manifest = {
+            'numFrames': self.numFrames,
+            'numRows': self.numRows,
+            'numCols': self.numCols,
+            'frameInterval': self.frameInterval,
+            'chunkSize': self.chunkSize,
+            'dtype': self.dtype.name,
+            'chunks': self.chunkNames,
+            'gridInfo': self.gridInfo
+        }
+        with open(os.path.join(self.directory, manifestName), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+# reads a directory written by TrajectoryWriter, the chunks are memory mapped and only
+# the pages of the frames that are used are read from the disk
+class TrajectoryReader:
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, manifestName)) as f:
+            manifest = json.load(f)
+
+        self.numFrames = manifest['numFrames']
+        self.numRows = manifest['numRows']
+        self.numCols = manifest['numCols']
+        self.frameInterval = manifest['frameInterval']
+        self.chunkSize = manifest['chunkSize']
+        self.dtype = np.dtype(manifest['dtype'])
+        self.gridInfo = manifest['gridInfo']
+        self.chunks = [np.load(os.path.join(directory, x), mmap_mode='r') for x in manifest['chunks']]
+
+    # numRows x numCols x 6 array of the frame, a view into the memory map if the stored dtype is float32
+    def get_frame(self, frameIndex):
+        frame = self.chunks[frameIndex // self.chunkSize][frameIndex % self.chunkSize]
+        return np.asarray(frame, np.float32)
+
+    # the frame shown at time t, the trajectory is looped
+    def get_frame_at(self, t):
+        return self.get_frame(int(t / self.frameInterval) % self.numFrames)
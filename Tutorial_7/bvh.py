@@ -0,0 +1,318 @@
+from Tutorial_7.graphic_object import *
+import time
+
+
+class BVHStatistics:
+
+    def __init__(self):
+        self.numRays = 0
+        self.nodesVisited = 0
+        self.primitiveTests = 0
+
+    def merge(self, other):
+        self.numRays += other.numRays
+        self.nodesVisited += other.nodesVisited
+        self.primitiveTests += other.primitiveTests
+
+    def __str__(self):
+        numRays = max(self.numRays, 1)
+        return 'rays: {}, nodes visited per ray: {:.2f}, primitive tests per ray: {:.2f}'.format(
+            self.numRays, self.nodesVisited / numRays, self.primitiveTests / numRays)
+
+
+def _surface_area(minCorner, maxCorner):
+    extent = np.maximum(maxCorner - minCorner, 0.0)
+    return 2.0 * (extent[..., 0] * extent[..., 1] + extent[..., 1] * extent[..., 2] + extent[..., 2] * extent[..., 0])
+
+
+# bounding volume hierarchy over Sphere and Triangle objects, built with binned SAH
+# closest hits are the smallest positive s along the ray
+class BVH:
+
+    def __init__(self, objects, maxLeafSize=4, numBins=16):
+        assert len(objects) > 0
+        assert maxLeafSize > 0 and numBins > 1
+
+        self.objects = list(objects)
+        self.maxLeafSize = maxLeafSize
+        self.numBins = numBins
+
+        # flattened nodes, a node is a leaf if nodeCounts > 0
+        self.nodeMins = []
+        self.nodeMaxs = []
+        self.nodeLefts = []
+        self.nodeRights = []
+        self.nodeStarts = []
+        self.nodeCounts = []
+        self.nodeAxes = []
+
+        # objects are reordered so that each leaf refers to a contiguous range
+        self.objectOrder = None
+
+        self.buildTime = 0.0
+        self.maxDepth = 0
+        self.stats = BVHStatistics()
+
+        startTime = time.time()
+        self._build()
+        self.buildTime = time.time() - startTime
+
+    @property
+    def numNodes(self):
+        return len(self.nodeCounts)
+
+    @property
+    def numLeaves(self):
+        return int(np.count_nonzero(self.nodeCounts > 0))
+
+    def get_build_info(self):
+        return 'objects: {}, nodes: {}, leaves: {}, max depth: {}, build time: {:.3f}s'.format(
+            len(self.objects), self.numNodes, self.numLeaves, self.maxDepth, self.buildTime)
+
+    def _add_node(self):
+        self.nodeMins.append(None)
+        self.nodeMaxs.append(None)
+        self.nodeLefts.append(-1)
+        self.nodeRights.append(-1)
+        self.nodeStarts.append(0)
+        self.nodeCounts.append(0)
+        self.nodeAxes.append(0)
+        return len(self.nodeCounts) - 1
+
+    def _find_split(self, centroids, mins, maxs):
+        centroidMin = centroids.min(axis=0)
+        centroidMax = centroids.max(axis=0)
+        extent = centroidMax - centroidMin
+        axis = int(np.argmax(extent))
+        if extent[axis] < 1.0e-12:
+            return axis, None
+
+        binIds = ((centroids[:, axis] - centroidMin[axis]) / extent[axis] * self.numBins).astype(np.int64)
+        binIds = np.clip(binIds, 0, self.numBins - 1)
+
+        binCounts = np.bincount(binIds, minlength=self.numBins)
+        binMins = np.full((self.numBins, 3), np.inf)
+        binMaxs = np.full((self.numBins, 3), -np.inf)
+        np.minimum.at(binMins, binIds, mins)
+        np.maximum.at(binMaxs, binIds, maxs)
+
+        # sweep from both sides, split k puts bins [0, k) to the left
+        leftCounts = np.cumsum(binCounts)[:-1]
+        leftAreas = _surface_area(np.minimum.accumulate(binMins)[:-1], np.maximum.accumulate(binMaxs)[:-1])
+        rightCounts = np.cumsum(binCounts[::-1])[::-1][1:]
+        rightAreas = _surface_area(np.minimum.accumulate(binMins[::-1])[::-1][1:],
+                                   np.maximum.accumulate(binMaxs[::-1])[::-1][1:])
+
+        costs = leftCounts * leftAreas + rightCounts * rightAreas
+        costs[(leftCounts == 0) | (rightCounts == 0)] = np.inf
+
+        bestSplit = int(np.argmin(costs))
+        if not np.isfinite(costs[bestSplit]):
+            return axis, None
+
+        return axis, binIds <= bestSplit
+
+    def _build(self):
+        bounds = [obj.get_bounds() for obj in self.objects]
+        allMins = np.asarray([b[0] for b in bounds], np.float64)
+        allMaxs = np.asarray([b[1] for b in bounds], np.float64)
+        allCentroids = (allMins + allMaxs) / 2.0
+
+        order = np.arange(len(self.objects))
+
+        rootId = self._add_node()
+        stack = [(rootId, 0, len(self.objects), 0)]
+
+        while len(stack) > 0:
+            nodeId, start, end, depth = stack.pop()
+            self.maxDepth = max(self.maxDepth, depth)
+
+            indices = order[start:end]
+            mins = allMins[indices]
+            maxs = allMaxs[indices]
+            # pad the boxes a little so that hits on the boundary are not culled
+            self.nodeMins[nodeId] = mins.min(axis=0) - 1.0e-7
+            self.nodeMaxs[nodeId] = maxs.max(axis=0) + 1.0e-7
+
+            count = end - start
+            if count <= self.maxLeafSize:
+                self.nodeStarts[nodeId] = start
+                self.nodeCounts[nodeId] = count
+                continue
+
+            axis, isLeft = self._find_split(allCentroids[indices], mins, maxs)
+            if isLeft is None:
+                # all centroids coincide, fall back to splitting in the middle of the list
+                isLeft = np.arange(count) < count // 2
+
+            order[start:end] = np.concatenate([indices[isLeft], indices[np.logical_not(isLeft)]])
+            middle = start + int(np.count_nonzero(isLeft))
+
+            leftId = self._add_node()
+            rightId = self._add_node()
+            self.nodeLefts[nodeId] = leftId
+            self.nodeRights[nodeId] = rightId
+            self.nodeAxes[nodeId] = axis
+
+            stack.append((rightId, middle, end, depth + 1))
+            stack.append((leftId, start, middle, depth + 1))
+
+        self.objectOrder = order
+        self.nodeMins = np.asarray(self.nodeMins)
+        self.nodeMaxs = np.asarray(self.nodeMaxs)
+        self.nodeLefts = np.asarray(self.nodeLefts)
+        self.nodeRights = np.asarray(self.nodeRights)
+        self.nodeStarts = np.asarray(self.nodeStarts)
+        self.nodeCounts = np.asarray(self.nodeCounts)
+        self.nodeAxes = np.asarray(self.nodeAxes)
+
+    def _intersect_node(self, nodeId, origin, invDir, maxS):
+        with np.errstate(invalid='ignore'):
+            t1 = (self.nodeMins[nodeId] - origin) * invDir
+            t2 = (self.nodeMaxs[nodeId] - origin) * invDir
+        tEnter = np.nanmax(np.fmin(t1, t2))
+        tExit = np.nanmin(np.fmax(t1, t2))
+        return tEnter <= tExit and tExit > 0.0 and tEnter < maxS
+
+    def _get_children_in_order(self, nodeId, dirAlongAxis):
+        # visit the nearer child first
+        if dirAlongAxis >= 0.0:
+            return self.nodeLefts[nodeId], self.nodeRights[nodeId]
+        return self.nodeRights[nodeId], self.nodeLefts[nodeId]
+
+    # returns (s, object), s is -1.0 and object is None if nothing is hit
+    def closest_hit(self, ray):
+        with np.errstate(divide='ignore'):
+            invDir = 1.0 / ray.dir
+
+        self.stats.numRays += 1
+        minS = np.inf
+        minObject = None
+
+        stack = [0]
+        while len(stack) > 0:
+            nodeId = stack.pop()
+            self.stats.nodesVisited += 1
+            if not self._intersect_node(nodeId, ray.origin, invDir, minS):
+                continue
+
+            count = self.nodeCounts[nodeId]
+            if count > 0:
+                start = self.nodeStarts[nodeId]
+                for objId in self.objectOrder[start:start + count]:
+                    obj = self.objects[objId]
+                    s = obj.intersect(ray)
+                    self.stats.primitiveTests += 1
+                    if 0.0 < s < minS:
+                        minS = s
+                        minObject = obj
+            else:
+                near, far = self._get_children_in_order(nodeId, ray.dir[self.nodeAxes[nodeId]])
+                stack.append(far)
+                stack.append(near)
+
+        if minObject is None:
+            return -1.0, None
+        return minS, minObject
+
+    def any_hit(self, ray):
+        with np.errstate(divide='ignore'):
+            invDir = 1.0 / ray.dir
+
+        self.stats.numRays += 1
+
+        stack = [0]
+        while len(stack) > 0:
+            nodeId = stack.pop()
+            self.stats.nodesVisited += 1
+            if not self._intersect_node(nodeId, ray.origin, invDir, np.inf):
+                continue
+
+            count = self.nodeCounts[nodeId]
+            if count > 0:
+                start = self.nodeStarts[nodeId]
+                for objId in self.objectOrder[start:start + count]:
+                    self.stats.primitiveTests += 1
+                    if self.objects[objId].intersect(ray) > 0.0:
+                        return True
+            else:
+                stack.append(self.nodeRights[nodeId])
+                stack.append(self.nodeLefts[nodeId])
+
+        return False
+
+    def _intersect_node_packet(self, nodeId, origins, invDirs, maxS):
+        with np.errstate(invalid='ignore'):
+            t1 = (self.nodeMins[nodeId] - origins) * invDirs
+            t2 = (self.nodeMaxs[nodeId] - origins) * invDirs
+        tEnter = np.nanmax(np.fmin(t1, t2), axis=1)
+        tExit = np.nanmin(np.fmax(t1, t2), axis=1)
+        return (tEnter <= tExit) & (tExit > 0.0) & (tEnter < maxS)
+
+    # packet version of closest_hit, rays are culled per node
+    # returns (isHit, objIndices, s), objIndices refer to self.objects
+    def closest_hit_packet(self, origins, dirs):
+        numRays = origins.shape[0]
+        with np.errstate(divide='ignore'):
+            invDirs = 1.0 / dirs
+
+        self.stats.numRays += numRays
+        minS = np.full(numRays, np.inf)
+        objIndices = np.zeros(numRays, np.int64)
+
+        stack = [(0, np.arange(numRays))]
+        while len(stack) > 0:
+            nodeId, rayIds = stack.pop()
+            self.stats.nodesVisited += rayIds.size
+            rayIds = rayIds[self._intersect_node_packet(nodeId, origins[rayIds], invDirs[rayIds], minS[rayIds])]
+            if rayIds.size == 0:
+                continue
+
+            count = self.nodeCounts[nodeId]
+            if count > 0:
+                start = self.nodeStarts[nodeId]
+                for objId in self.objectOrder[start:start + count]:
+                    s = self.objects[objId].intersect_packet(origins[rayIds], dirs[rayIds])
+                    self.stats.primitiveTests += rayIds.size
+                    closer = (s > 0.0) & (s < minS[rayIds])
+                    minS[rayIds[closer]] = s[closer]
+                    objIndices[rayIds[closer]] = objId
+            else:
+                near, far = self._get_children_in_order(
+                    nodeId, np.mean(dirs[rayIds, self.nodeAxes[nodeId]]))
+                stack.append((far, rayIds))
+                stack.append((near, rayIds))
+
+        isHit = np.isfinite(minS)
+        return isHit, objIndices, np.where(isHit, minS, -1.0)
+
+    def any_hit_packet(self, origins, dirs):
+        numRays = origins.shape[0]
+        with np.errstate(divide='ignore'):
+            invDirs = 1.0 / dirs
+
+        self.stats.numRays += numRays
+        result = np.zeros(numRays, np.bool_)
+        noLimit = np.full(numRays, np.inf)
+
+        stack = [(0, np.arange(numRays))]
+        while len(stack) > 0:
+            nodeId, rayIds = stack.pop()
+            # rays that are already blocked need no more tests
+            rayIds = rayIds[np.logical_not(result[rayIds])]
+            self.stats.nodesVisited += rayIds.size
+            rayIds = rayIds[self._intersect_node_packet(nodeId, origins[rayIds], invDirs[rayIds], noLimit[rayIds])]
+            if rayIds.size == 0:
+                continue
+
+            count = self.nodeCounts[nodeId]
+            if count > 0:
+                start = self.nodeStarts[nodeId]
+                for objId in self.objectOrder[start:start + count]:
+                    self.stats.primitiveTests += rayIds.size
+                    result[rayIds] |= self.objects[objId].intersect_packet(origins[rayIds], dirs[rayIds]) > 0.0
+            else:
+                stack.append((self.nodeRights[nodeId], rayIds))
+                stack.append((self.nodeLefts[nodeId], rayIds))
+
+        return result
@@ -1,5 +1,9 @@
 import numpy as np
-from gl_lib.transmat import normalized
+from gl_lib.transmat import normalized, normalized_rows
+
+# row-wise dot product of two (N, 3) arrays
+def dot_rows(a, b):
+    return np.einsum('ij,ij->i', a, b)
 
 class PhongShading:
 
@@ -22,6 +26,18 @@ class PhongShading:
         shadeColor = (ambient + diffuse + specular) * self.color
         return shadeColor
 
+    # same as shade, but for (N, 3) arrays of normals/directions
+    def shade_packet(self, normals, lightDirs, viewDirs, lightColor):
+        ambient = np.ones(3, np.float32) * self.ambientCoef
+        normalDotLight = dot_rows(normals, lightDirs)
+        diffuse = np.maximum(0.0, normalDotLight)[:, None] * lightColor
+        reflectDirs = -lightDirs + 2.0 * normalDotLight[:, None] * normals
+        specular = np.power(np.maximum(0.0, dot_rows(viewDirs, reflectDirs)),
+                            self.phongP)[:, None] * self.specularCoef * lightColor
+
+        shadeColor = (ambient + diffuse + specular) * self.color
+        return shadeColor
+
 class Ray:
 
     def __init__(self, origin=np.zeros(3, np.float), dir=np.zeros(3, np.float)):
@@ -53,9 +69,31 @@ class Sphere:
 
         return -1.0
 
+    # intersect a packet of rays given as (N, 3) origins and directions
+    # returns an array of s, where -1.0 means no intersection
+    def intersect_packet(self, origins, dirs):
+        a = dot_rows(dirs, dirs)
+        b = 2.0 * (dot_rows(origins, dirs) - dirs @ self.origin)
+        c = self.origin @ self.origin + dot_rows(origins, origins) - 2.0 * origins @ self.origin - self.radius**2
+
+        delta = b**2 - 4.0 * a * c
+        result = np.full(a.shape[0], -1.0)
+        valid = delta >= 1.0e-3
+        s = (-b[valid] - np.sqrt(delta[valid])) / (2.0 * a[valid])
+        result[np.flatnonzero(valid)[s > 1.0e-3]] = s[s > 1.0e-3]
+
+        return result
+
     def normal(self, pos):
         return normalized(pos - self.origin)
 
+    def normal_packet(self, pos):
+        return normalized_rows(pos - self.origin)
+
+    # axis-aligned bounding box as (minCorner, maxCorner)
+    def get_bounds(self):
+        return self.origin - self.radius, self.origin + self.radius
+
 
 class Triangle:
 
@@ -63,7 +101,9 @@ class Triangle:
         self.p1 = p1
         self.p2 = p2
         self.p3 = p3
-        self.normalVec = normalized(np.cross(p2 - p1, p3 - p1))
+        # small triangles (e.g. from tessellated meshes) are below the tolerance of normalized()
+        crossVec = np.cross(p2 - p1, p3 - p1)
+        self.normalVec = crossVec / np.linalg.norm(crossVec)
 
         self.mat = np.zeros((3, 3), np.float)
         self.mat[:, 0] = p2 - p1
@@ -75,7 +115,7 @@ class Triangle:
         self.shadeParam = PhongShading()
 
     def intersect(self, ray):
-        s = (self.p1 @ self.normalVec - ray.origin @ self.normalVec) / ray.dir @ self.normalVec
+        s = (self.p1 @ self.normalVec - ray.origin @ self.normalVec) / (ray.dir @ self.normalVec)
         pos = ray.get_pos(s)
 
         para = self.invMat @ (pos - self.p1)
@@ -84,5 +124,24 @@ class Triangle:
 
         return -1.0
 
+    def intersect_packet(self, origins, dirs):
+        # rays parallel to the triangle produce inf/nan, which fail the tests below
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = (self.p1 @ self.normalVec - origins @ self.normalVec) / (dirs @ self.normalVec)
+            pos = origins + s[:, None] * dirs
+
+            para = (pos - self.p1) @ self.invMat.T
+            inside = (para[:, 0] >= 0.0) & (para[:, 1] >= 0.0) & (para[:, 0] + para[:, 1] <= 1.0)
+
+        return np.where(inside, s, -1.0)
+
     def normal(self, pos):
         return self.normalVec
+
+    def normal_packet(self, pos):
+        return np.broadcast_to(self.normalVec, pos.shape)
+
+    def get_bounds(self):
+        points = np.stack([self.p1, self.p2, self.p3])
+        return points.min(axis=0), points.max(axis=0)
+
@@ -1,8 +1,12 @@
 from Tutorial_7.graphic_object import *
+from Tutorial_7.packet_tracer import packet_ray_trace
+from Tutorial_7.bvh import BVH, BVHStatistics
+from Tutorial_7.tile_scheduler import TileScheduler, print_tile_timing
+from Tutorial_7.progressive import ProgressiveRenderer
+from misc.sphere_tessellation import uniform_tessellate_half_sphere_array
 import matplotlib.pyplot as plt
 from queue import Queue
-from multiprocessing import Pool
-from functools import partial
+import time
 
 class RayTracingConfig:
 
@@ -33,7 +37,54 @@ class RayTracingConfig:
 
         return topLeft + (i + 0.5) * unitDown + (j + 0.5) * unitRight
 
-def ray_trace(config, objects, pxIndLst):
+    # pxInds: (N, 2) array of pixel indices
+    def get_screen_pos_array(self, pxInds):
+        cameraRight = normalized(np.cross(self.cameraFront, self.cameraUp))
+        screenPoint = self.cameraOrigin + self.cameraFocalLength * self.cameraFront
+
+        unitDown = -self.pixelSize * self.cameraUp
+        unitRight = self.pixelSize * cameraRight
+
+        topLeft = screenPoint - (self.imageShape[0] / 2) * unitDown - (self.imageShape[1] / 2) * unitRight
+
+        return topLeft + (pxInds[:, 0, None] + 0.5) * unitDown + (pxInds[:, 1, None] + 0.5) * unitRight
+
+# objects can either be a list of objects or a BVH
+def find_closest_intersection(config, objects, ray):
+    if isinstance(objects, BVH):
+        return objects.closest_hit(ray)
+
+    minEyeDistance = 1.0e100
+    minDistObject = None
+    minDistS = 0.0
+
+    for obj in objects:
+        s = obj.intersect(ray)
+
+        if s > 0.0:
+            pos = ray.get_pos(s)
+
+            eyeDist = np.linalg.norm(config.cameraOrigin - pos)
+            if eyeDist < minEyeDistance:
+                minEyeDistance = eyeDist
+                minDistObject = obj
+                minDistS = s
+
+    return minDistS, minDistObject
+
+def has_any_intersection(objects, ray):
+    if isinstance(objects, BVH):
+        return objects.any_hit(ray)
+
+    for obj in objects:
+        s = obj.intersect(ray)
+        if s > 0.0:
+            return True
+
+    return False
+
+# the colors are accumulated into result if it is given, otherwise into a new image
+def ray_trace(config, objects, pxIndLst, result=None):
     rayQueue = Queue()
 
     for pxInd in pxIndLst:
@@ -41,28 +92,15 @@ def ray_trace(config, objects, pxIndLst):
         ray = Ray(config.cameraOrigin, normalized(screenPos - config.cameraOrigin))
         rayQueue.put((ray, pxInd, 1.0, 1))
 
-    result = np.zeros([config.imageShape[0], config.imageShape[1], 3], np.float32)
+    if result is None:
+        result = np.zeros([config.imageShape[0], config.imageShape[1], 3], np.float32)
 
     while not rayQueue.empty():
         ray, pxInd, strength, depth = rayQueue.get()
         if strength < config.strengthThreshold:
             continue
 
-        minEyeDistance = 1.0e100
-        minDistObject = None
-        minDistS = 0.0
-
-        for obj in objects:
-            s = obj.intersect(ray)
-
-            if s > 0.0:
-                pos = ray.get_pos(s)
-
-                eyeDist = np.linalg.norm(config.cameraOrigin - pos)
-                if eyeDist < minEyeDistance:
-                    minEyeDistance = eyeDist
-                    minDistObject = obj
-                    minDistS = s
+        minDistS, minDistObject = find_closest_intersection(config, objects, ray)
 
         if minDistObject is not None:
             # do shadow ray intersection test
@@ -71,13 +109,7 @@ def ray_trace(config, objects, pxIndLst):
             backOrigin = ray.get_pos(minDistS - 1.0e-3)
             backRay = Ray(backOrigin, lightDir)
 
-            noBackIntersection = True
-            for obj in objects:
-                s = obj.intersect(backRay)
-                if s > 0.0:
-                    noBackIntersection = False
-                    break
-
+            noBackIntersection = not has_any_intersection(objects, backRay)
 
             if noBackIntersection:
                 obj = minDistObject
@@ -133,24 +165,70 @@ objects = [
     tri2
 ]
 
+# add a tessellated dome to stress test the acceleration structure
+# (thetaStep, phiStep) = (100, 100) gives about 20,000 triangles
+addTessellatedDome = False
+if addTessellatedDome:
+    domeOffset = np.asarray([0.0, -1.0, -1.0])
+    domeData = uniform_tessellate_half_sphere_array(100, 100, np.float64).reshape((-1, 3, 6))
+    for vertices in domeData[:, :, :3] * 0.8 + domeOffset:
+        # skip the degenerate triangles around the pole
+        if np.linalg.norm(np.cross(vertices[1] - vertices[0], vertices[2] - vertices[0])) < 1.0e-12:
+            continue
+        domeTriangle = Triangle(*vertices)
+        domeTriangle.shadeParam.color = np.asarray([0.3, 0.4, 0.8], np.float32)
+        objects.append(domeTriangle)
+
+# trace against a BVH instead of testing every object for every ray
+useBVH = True
+if useBVH:
+    scene = BVH(objects)
+    print('BVH built:', scene.get_build_info())
+else:
+    scene = objects
+
 # how many processes in the process pool
 concurrency = 10
+# the image is divided into tileSize x tileSize tiles that are handed out to the workers
+tileSize = 32
+
+# 'scalar': trace one Ray at a time (ray_trace)
+# 'packet': trace arrays of rays with NumPy (packet_ray_trace)
+tracingMode = 'packet'
+
+tracingFuncs = {
+    'scalar': ray_trace,
+    'packet': packet_ray_trace
+}
+
+# render a coarse image first and refine it where the image changes
+# the intermediate frames are saved as progressive_<pass>.png
+progressiveMode = False
+progressiveInitialStep = 8
+
+def save_progressive_frame(passIndex, step, image, numTracedPixels):
+    print('pass {} (step {}): traced {} pixels'.format(passIndex, step, numTracedPixels))
+    plt.imsave('progressive_{}.png'.format(passIndex), np.clip(image, 0.0, 1.0))
+
+scheduler = TileScheduler(config.imageShape, tileSize, concurrency)
+startTime = time.time()
+
+if progressiveMode:
+    renderer = ProgressiveRenderer(scheduler, progressiveInitialStep)
+    result, totalTraced = renderer.render(tracingFuncs[tracingMode], config, scene, save_progressive_frame)
+    print('{} progressive ray tracing finished in {:.2f}s, traced {} of {} pixels'.format(
+        tracingMode, time.time() - startTime, totalTraced, config.imageShape[0] * config.imageShape[1]))
+else:
+    result, tileResults = scheduler.render(tracingFuncs[tracingMode], config, scene)
+    print('{} ray tracing finished in {:.2f}s'.format(tracingMode, time.time() - startTime))
+    print_tile_timing(tileResults)
+
+    if useBVH:
+        traversalStats = BVHStatistics()
+        for tileResult in tileResults:
+            traversalStats.merge(tileResult.stats)
+        print('BVH traversal:', traversalStats)
 
-pxInds = sum([[(i, j) for j in range(config.imageShape[1])] for i in range(config.imageShape[0])], [])
-
-
-def split(a, n):
-    k, m = divmod(len(a), n)
-    return (a[i * k + min(i, m):(i + 1) * k + min(i + 1, m)] for i in range(n))
-
-splitPxInds = list(split(pxInds, concurrency))
-
-ray_trace_func = partial(ray_trace, config, objects)
-pool = Pool(concurrency)
-allResults = pool.map(ray_trace_func, splitPxInds, chunksize=1)
-allResults = np.asarray(allResults)
-
-result = np.sum(allResults, axis=0)
 result = (np.clip(result, 0.0, 1.0) * 255.0).astype(np.uint8)
 plt.imshow(result)
 plt.show()
\ No newline at end of file
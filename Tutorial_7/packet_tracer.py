@@ -0,0 +1,96 @@
+from Tutorial_7.graphic_object import *
+from Tutorial_7.bvh import BVH
+
+# traces whole arrays of rays at once instead of one Ray at a time
+# the shading model is the same as ray_trace in main.py
+# objects can either be a list of objects or a BVH
+
+
+def _closest_intersection(config, objects, origins, dirs):
+    if isinstance(objects, BVH):
+        return objects.closest_hit_packet(origins, dirs)
+
+    # s of every ray against every object, shape (N, numObjects)
+    allS = np.stack([obj.intersect_packet(origins, dirs) for obj in objects], axis=1)
+
+    # like the scalar path, the closest object is the one nearest to the eye
+    allPos = origins[:, None, :] + allS[:, :, None] * dirs[:, None, :]
+    eyeDist = np.linalg.norm(config.cameraOrigin - allPos, axis=2)
+    eyeDist[allS <= 0.0] = np.inf
+
+    objIndices = np.argmin(eyeDist, axis=1)
+    rayIndices = np.arange(origins.shape[0])
+    isHit = np.isfinite(eyeDist[rayIndices, objIndices])
+
+    return isHit, objIndices, allS[rayIndices, objIndices]
+
+
+def _any_intersection(objects, origins, dirs):
+    if isinstance(objects, BVH):
+        return objects.any_hit_packet(origins, dirs)
+
+    result = np.zeros(origins.shape[0], np.bool_)
+    for obj in objects:
+        result |= obj.intersect_packet(origins, dirs) > 0.0
+    return result
+
+
+# the colors are accumulated into result if it is given, otherwise into a new image
+def packet_ray_trace(config, objects, pxIndLst, result=None):
+    pxInds = np.asarray(pxIndLst, np.int64).reshape((-1, 2))
+
+    # primary rays
+    screenPos = config.get_screen_pos_array(pxInds)
+    origins = np.broadcast_to(config.cameraOrigin, screenPos.shape).astype(np.float64)
+    dirs = normalized_rows(screenPos - config.cameraOrigin)
+    strengths = np.ones(pxInds.shape[0])
+
+    objectList = objects.objects if isinstance(objects, BVH) else objects
+
+    if result is None:
+        result = np.zeros([config.imageShape[0], config.imageShape[1], 3], np.float32)
+
+    # each iteration traces one generation of rays (primary, first reflection, ...)
+    while pxInds.shape[0] > 0:
+        active = strengths >= config.strengthThreshold
+        origins, dirs, pxInds, strengths = origins[active], dirs[active], pxInds[active], strengths[active]
+
+        isHit, objIndices, hitS = _closest_intersection(config, objects, origins, dirs)
+        origins, dirs, pxInds, strengths = origins[isHit], dirs[isHit], pxInds[isHit], strengths[isHit]
+        objIndices, hitS = objIndices[isHit], hitS[isHit]
+
+        # do shadow ray intersection test
+        pos = origins + hitS[:, None] * dirs
+        lightDirs = normalized_rows(config.lightPos - pos)
+        backOrigins = origins + (hitS - 1.0e-3)[:, None] * dirs
+
+        isLit = np.logical_not(_any_intersection(objects, backOrigins, lightDirs))
+        pos, lightDirs, backOrigins = pos[isLit], lightDirs[isLit], backOrigins[isLit]
+        pxInds, strengths, objIndices = pxInds[isLit], strengths[isLit], objIndices[isLit]
+
+        normals = np.zeros(pos.shape)
+        shadeColors = np.zeros(pos.shape, np.float32)
+        reflectionStrengths = np.zeros(pos.shape[0])
+        viewDirs = normalized_rows(config.cameraOrigin - pos)
+
+        # apply shading, grouped by the object that is hit
+        rayOrder = np.argsort(objIndices, kind='stable')
+        hitObjIndices, groupStarts = np.unique(objIndices[rayOrder], return_index=True)
+        groupEnds = np.append(groupStarts[1:], rayOrder.size)
+        for objId, groupStart, groupEnd in zip(hitObjIndices, groupStarts, groupEnds):
+            obj = objectList[objId]
+            group = rayOrder[groupStart:groupEnd]
+            normals[group] = obj.normal_packet(pos[group])
+            shadeColors[group] = obj.shadeParam.shade_packet(normals[group], lightDirs[group], viewDirs[group],
+                                                             config.lightColor)
+            reflectionStrengths[group] = obj.shadeParam.reflectionStrength
+
+        # each pixel owns at most one ray per generation, so there are no duplicate indices
+        result[pxInds[:, 0], pxInds[:, 1], :] += shadeColors
+
+        # compute reflection direction, starting from the offset origin to avoid self intersection
+        origins = backOrigins
+        dirs = -lightDirs + 2.0 * dot_rows(normals, lightDirs)[:, None] * normals
+        strengths = strengths * reflectionStrengths
+
+    return result
@@ -0,0 +1,87 @@
+import numpy as np
+
+
+# renders every initialStep-th pixel first, then halves the step until every pixel is covered
+# in each refinement pass, new pixels are only traced inside blocks whose corner samples differ
+# by more than diffThreshold; the other new pixels copy the color of their block
+class ProgressiveRenderer:
+
+    def __init__(self, scheduler, initialStep=8, diffThreshold=0.02):
+        # initialStep must be a power of 2
+        assert initialStep >= 1 and (initialStep & (initialStep - 1)) == 0
+        self.scheduler = scheduler
+        self.initialStep = initialStep
+        self.diffThreshold = diffThreshold
+
+    def _get_grid_mask(self, step):
+        mask = np.zeros(self.scheduler.imageShape, np.bool_)
+        mask[::step, ::step] = True
+        return mask
+
+    def _get_block_variation(self, samples, step):
+        # samples: colors on the grid of the given step
+        # variation of a block is the max color difference between its corners
+        grid = samples[::step, ::step]
+        paddedGrid = np.pad(grid, ((0, 1), (0, 1), (0, 0)), mode='edge')
+        corners = [
+            paddedGrid[:-1, :-1],
+            paddedGrid[1:, :-1],
+            paddedGrid[:-1, 1:],
+            paddedGrid[1:, 1:]
+        ]
+        diffs = [np.max(np.abs(corner - corners[0]), axis=2) for corner in corners[1:]]
+        return np.max(diffs, axis=0)
+
+    # expand one value per block to the full image
+    def _expand_blocks(self, blockValues, step):
+        filled = np.repeat(np.repeat(blockValues, step, axis=0), step, axis=1)
+        return filled[:self.scheduler.imageShape[0], :self.scheduler.imageShape[1]]
+
+    # fill every block with its top-left sample
+    def _fill_blocks(self, samples, step):
+        return self._expand_blocks(samples[::step, ::step], step)
+
+    # callback(passIndex, step, image, numTracedPixels) is called after every pass
+    # returns the final image and the total number of traced pixels
+    def render(self, tracingFunc, config, scene, callback=None):
+        step = self.initialStep
+        traceMask = self._get_grid_mask(step)
+
+        samples = np.zeros((self.scheduler.imageShape[0], self.scheduler.imageShape[1], 3), np.float32)
+        totalTraced = 0
+        passIndex = 0
+
+        # one worker pool and framebuffer for all passes
+        with self.scheduler.open(tracingFunc, config, scene):
+            while True:
+                if np.any(traceMask):
+                    passResult, _ = self.scheduler.render_mask(traceMask)
+                    samples[traceMask] = passResult[traceMask]
+
+                numTraced = int(np.count_nonzero(traceMask))
+                totalTraced += numTraced
+
+                if callback is not None:
+                    callback(passIndex, step, self._fill_blocks(samples, step), numTraced)
+
+                if step == 1:
+                    break
+
+                # decide which blocks of the current step need refinement
+                refineBlocks = self._get_block_variation(samples, step) > self.diffThreshold
+                refineMask = self._expand_blocks(refineBlocks, step)
+
+                # new samples are the pixels on the finer grid that are not on the current grid
+                newStep = step // 2
+                newSampleMask = np.logical_and(self._get_grid_mask(newStep),
+                                               np.logical_not(self._get_grid_mask(step)))
+
+                # copy the block color to the new samples in flat blocks
+                inheritMask = np.logical_and(newSampleMask, np.logical_not(refineMask))
+                samples[inheritMask] = self._fill_blocks(samples, step)[inheritMask]
+
+                traceMask = np.logical_and(newSampleMask, refineMask)
+                step = newStep
+                passIndex += 1
+
+        return samples, totalTraced
@@ -0,0 +1,173 @@
+from multiprocessing import Pool, shared_memory, resource_tracker, util
+from Tutorial_7.bvh import BVH, BVHStatistics
+import numpy as np
+import time
+import sys
+import os
+
+
+class TileResult:
+
+    def __init__(self, tile, elapsed, workerId, stats):
+        # (top, left, bottom, right)
+        self.tile = tile
+        self.elapsed = elapsed
+        self.workerId = workerId
+        # BVHStatistics of this tile, None if the scene is not a BVH
+        self.stats = stats
+
+
+# states of a worker process, set once by _init_worker
+_workerState = dict()
+
+
+# attaches to a segment owned by the parent process without registering it with the resource tracker,
+# otherwise the tracker may warn about a leak or unlink it a second time after the parent has unlinked it
+def _attach_shared_memory(shmName):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shmName, track=False)
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=shmName)
+    finally:
+        resource_tracker.register = register
+
+
+def _close_worker_state():
+    # the framebuffer must be released before the memory map can be closed
+    _workerState.pop('framebuffer', None)
+    shm = _workerState.pop('shm', None)
+    if shm is not None:
+        shm.close()
+
+
+def _init_worker(shmName, imageShape, tracingFunc, config, scene):
+    shm = _attach_shared_memory(shmName)
+    util.Finalize(None, _close_worker_state, exitpriority=10)
+    _workerState['shm'] = shm
+    _workerState['framebuffer'] = np.ndarray((imageShape[0], imageShape[1], 3), np.float32, buffer=shm.buf)
+    _workerState['tracingFunc'] = tracingFunc
+    _workerState['config'] = config
+    _workerState['scene'] = scene
+
+
+def _render_tile(task):
+    tile, tileMask = task
+    top, left, bottom, right = tile
+    scene = _workerState['scene']
+    if isinstance(scene, BVH):
+        scene.stats = BVHStatistics()
+
+    rows, cols = np.mgrid[top:bottom, left:right]
+    if tileMask is not None:
+        rows, cols = rows[tileMask], cols[tileMask]
+    pxInds = np.stack([rows.flatten(), cols.flatten()], axis=1)
+
+    startTime = time.time()
+    # tiles do not overlap, so workers can write into the framebuffer without locking
+    _workerState['tracingFunc'](_workerState['config'], scene, pxInds, _workerState['framebuffer'])
+    elapsed = time.time() - startTime
+
+    return TileResult(tile, elapsed, os.getpid(), scene.stats if isinstance(scene, BVH) else None)
+
+
+class TileScheduler:
+
+    def __init__(self, imageShape, tileSize=32, concurrency=None):
+        assert tileSize > 0
+        self.imageShape = imageShape
+        self.tileSize = tileSize
+        self.concurrency = os.cpu_count() if concurrency is None else concurrency
+
+        # set by open()
+        self._pool = None
+        self._shm = None
+        self._framebuffer = None
+
+    def get_tiles(self):
+        tiles = []
+        for top in range(0, self.imageShape[0], self.tileSize):
+            for left in range(0, self.imageShape[1], self.tileSize):
+                bottom = min(top + self.tileSize, self.imageShape[0])
+                right = min(left + self.tileSize, self.imageShape[1])
+                tiles.append((top, left, bottom, right))
+        return tiles
+
+    # starts the worker pool and the shared framebuffer, they are kept until close() so that several
+    # render_mask calls (e.g. the passes of progressive rendering) do not pay for the setup again
+    # tracingFunc(config, scene, pxInds, result) accumulates colors into result
+    # usage: with scheduler.open(tracingFunc, config, scene): scheduler.render_mask(mask)
+    def open(self, tracingFunc, config, scene):
+        assert self._pool is None
+        frameShape = (self.imageShape[0], self.imageShape[1], 3)
+        frameSize = int(np.prod(frameShape)) * np.dtype(np.float32).itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=frameSize)
+        self._framebuffer = np.ndarray(frameShape, np.float32, buffer=self._shm.buf)
+
+        # idle workers pull the next tile, so expensive tiles do not hold up the others
+        initArgs = (self._shm.name, self.imageShape, tracingFunc, config, scene)
+        try:
+            self._pool = Pool(self.concurrency, initializer=_init_worker, initargs=initArgs)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def close(self):
+        if self._pool is not None:
+            # let the workers exit normally so that they close their handles
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._shm is not None:
+            self._framebuffer = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # renders with the pool started by open()
+    # only the pixels where pixelMask is True are traced if pixelMask is given
+    # returns the image and a list of TileResult
+    def render_mask(self, pixelMask=None):
+        assert self._pool is not None
+        self._framebuffer.fill(0.0)
+
+        tasks = []
+        for tile in self.get_tiles():
+            if pixelMask is None:
+                tasks.append((tile, None))
+                continue
+            tileMask = pixelMask[tile[0]:tile[2], tile[1]:tile[3]]
+            if np.any(tileMask):
+                tasks.append((tile, tileMask))
+
+        tileResults = list(self._pool.imap_unordered(_render_tile, tasks, chunksize=1))
+        return np.copy(self._framebuffer), tileResults
+
+    # renders one image with a pool that only lives for this call
+    def render(self, tracingFunc, config, scene, pixelMask=None):
+        with self.open(tracingFunc, config, scene):
+            return self.render_mask(pixelMask)
+
+
+def print_tile_timing(tileResults, numSlowest=5):
+    elapsed = np.asarray([x.elapsed for x in tileResults])
+    print('tiles: {}, mean: {:.3f}s, max: {:.3f}s, total: {:.2f}s'.format(
+        len(tileResults), elapsed.mean(), elapsed.max(), elapsed.sum()))
+
+    for x in sorted(tileResults, key=lambda x: x.elapsed, reverse=True)[:numSlowest]:
+        print('  tile {}: {:.3f}s'.format(x.tile, x.elapsed))
+
+    workerTimes = dict()
+    for x in tileResults:
+        workerTimes[x.workerId] = workerTimes.get(x.workerId, 0.0) + x.elapsed
+    for workerId, total in sorted(workerTimes.items()):
+        print('  worker {}: {:.2f}s'.format(workerId, total))
@@ -20,10 +20,18 @@ def unit_y():
 def unit_z():
     return np.array((0, 0, 1), np.float32)
 
-def scale(*args):
+# returns out (cleared) if it is given, otherwise a new float32 array
+def _get_output(shape, out):
+    if out is None:
+        return np.zeros(shape, np.float32)
+    assert out.shape == shape
+    out.fill(0.0)
+    return out
+
+def scale(*args, out=None):
     assert len(args) == 3
     
-    result = np.zeros((4, 4), np.float32)
+    result = _get_output((4, 4), out)
     result[0, 0] = args[0]
     result[1, 1] = args[1]
     result[2, 2] = args[2]
@@ -31,10 +39,11 @@ def scale(*args):
 
     return result
 
-def translate(*args):
+def translate(*args, out=None):
     assert len(args) == 3
 
-    result = np.identity(4, dtype=np.float32)
+    result = _get_output((4, 4), out)
+    np.fill_diagonal(result, 1.0)
     result[0, 3] = args[0]
     result[1, 3] = args[1]
     result[2, 3] = args[2]
@@ -51,7 +60,7 @@ def _cross_product_matrix(axis):
         np.float32
     )
 
-def rotate(axis, angle, degree=False):
+def rotate(axis, angle, degree=False, out=None):
     assert axis.size == 3
 
     axis = normalized(axis)
@@ -62,18 +71,18 @@ def rotate(axis, angle, degree=False):
     mat3 = np.cos(angle) * np.identity(3, dtype=np.float32) + np.sin(angle) * _cross_product_matrix(axis) + \
            (1 - np.cos(angle)) * np.outer(axis, axis)
 
-    result = np.zeros((4, 4), np.float32)
+    result = _get_output((4, 4), out)
     result[:3, :3] = mat3
     result[3, 3] = 1.0
 
     return result
 
-def look_at(eye, center, up):
+def look_at(eye, center, up, out=None):
     z = normalized(eye - center)
     x = normalized(np.cross(up, z))
     y = np.cross(z, x)
 
-    result = np.zeros((4, 4), np.float32)
+    result = _get_output((4, 4), out)
     result[0, :3] = x
     result[1, :3] = y
     result[2, :3] = z
@@ -84,7 +93,7 @@ def look_at(eye, center, up):
 
     return result
 
-def perspective_projection(fovy, aspect, zNear, zFar, degree=False):
+def perspective_projection(fovy, aspect, zNear, zFar, degree=False, out=None):
     assert abs(aspect) > _nonZeroEps
     assert abs(zNear - zFar) > _nonZeroEps
     if degree:
@@ -92,7 +101,7 @@ def perspective_projection(fovy, aspect, zNear, zFar, degree=False):
 
     tanHalf = np.tan(fovy / 2.0)
 
-    result = np.zeros((4, 4), np.float32)
+    result = _get_output((4, 4), out)
     result[0, 0] = 1.0 / (aspect * tanHalf)
     result[1, 1] = 1.0 / tanHalf
     result[2, 2] = -(zFar + zNear)/(zFar - zNear)
@@ -102,12 +111,12 @@ def perspective_projection(fovy, aspect, zNear, zFar, degree=False):
     return result
 
 
-def orthographic_projection(left, right, bottom, top, zNear, zFar):
+def orthographic_projection(left, right, bottom, top, zNear, zFar, out=None):
     assert abs(right - left) > _nonZeroEps
     assert abs(top - bottom) > _nonZeroEps
     assert abs(zNear - zFar) > _nonZeroEps
 
-    result = np.zeros((4, 4), np.float32)
+    result = _get_output((4, 4), out)
     result[0, 0] = 2.0 / (right - left)
     result[1, 1] = 2.0 / (top - bottom)
     result[2, 2] = -2.0 / (zFar - zNear)
@@ -116,4 +125,111 @@ def orthographic_projection(left, right, bottom, top, zNear, zFar):
     result[1, 3] = -(top + bottom) / (top - bottom)
     result[2, 3] = -(zFar + zNear) / (zFar - zNear)
 
-    return result
\ No newline at end of file
+    return result
+
+
+# batched versions of the functions above
+# parameters are broadcast to N instances and the results are stacked into an N x 4 x 4 array
+
+def _check_non_zero_rows(array):
+    norms = np.linalg.norm(array, axis=-1)
+    assert np.all(np.abs(norms) > _nonZeroEps)
+    return norms
+
+def normalized_rows(array):
+    norms = _check_non_zero_rows(array)
+    return array / norms[..., None]
+
+# factors: N x 3
+def scale_batch(factors, out=None):
+    factors = np.asarray(factors)
+    assert factors.ndim == 2 and factors.shape[1] == 3
+
+    result = _get_output((factors.shape[0], 4, 4), out)
+    result[:, [0, 1, 2], [0, 1, 2]] = factors
+    result[:, 3, 3] = 1.0
+
+    return result
+
+# offsets: N x 3
+def translate_batch(offsets, out=None):
+    offsets = np.asarray(offsets)
+    assert offsets.ndim == 2 and offsets.shape[1] == 3
+
+    result = _get_output((offsets.shape[0], 4, 4), out)
+    result[:, [0, 1, 2, 3], [0, 1, 2, 3]] = 1.0
+    result[:, :3, 3] = offsets
+
+    return result
+
+# axes: N x 3 or 3, angles: N or scalar
+def rotate_batch(axes, angles, degree=False, out=None):
+    axes = np.asarray(axes, np.float64)
+    angles = np.asarray(angles, np.float64)
+    assert axes.shape[-1] == 3
+
+    numMats = np.broadcast(axes[..., 0], angles).size
+    axes = np.broadcast_to(normalized_rows(axes), (numMats, 3))
+    angles = np.broadcast_to(angles, (numMats,))
+
+    if degree:
+        angles = np.deg2rad(angles)
+
+    cosA = np.cos(angles)
+    sinA = np.sin(angles)
+    x, y, z = axes[:, 0], axes[:, 1], axes[:, 2]
+
+    result = _get_output((numMats, 4, 4), out)
+    # cos * I + sin * K + (1 - cos) * outer(axis, axis)
+    result[:, :3, :3] = (1.0 - cosA)[:, None, None] * (axes[:, :, None] * axes[:, None, :])
+    result[:, [0, 1, 2], [0, 1, 2]] += cosA[:, None]
+    result[:, 0, 1] -= sinA * z
+    result[:, 0, 2] += sinA * y
+    result[:, 1, 0] += sinA * z
+    result[:, 1, 2] -= sinA * x
+    result[:, 2, 0] -= sinA * y
+    result[:, 2, 1] += sinA * x
+    result[:, 3, 3] = 1.0
+
+    return result
+
+# eyes, centers, ups: N x 3 or 3
+def look_at_batch(eyes, centers, ups, out=None):
+    eyes, centers, ups = np.asarray(eyes), np.asarray(centers), np.asarray(ups)
+    numMats = np.broadcast(eyes[..., 0], centers[..., 0], ups[..., 0]).size
+    eyes = np.broadcast_to(eyes, (numMats, 3))
+
+    z = normalized_rows(eyes - centers)
+    x = normalized_rows(np.cross(ups, z))
+    y = np.cross(z, x)
+
+    result = _get_output((numMats, 4, 4), out)
+    result[:, 0, :3] = x
+    result[:, 1, :3] = y
+    result[:, 2, :3] = z
+    result[:, 0, 3] = -np.einsum('ij,ij->i', x, eyes)
+    result[:, 1, 3] = -np.einsum('ij,ij->i', y, eyes)
+    result[:, 2, 3] = -np.einsum('ij,ij->i', z, eyes)
+    result[:, 3, 3] = 1.0
+
+    return result
+
+# all parameters: N or scalar
+def perspective_projection_batch(fovys, aspects, zNears, zFars, degree=False, out=None):
+    fovys, aspects, zNears, zFars = np.broadcast_arrays(*[np.asarray(x, np.float64).reshape(-1)
+                                                          for x in (fovys, aspects, zNears, zFars)])
+    assert np.all(np.abs(aspects) > _nonZeroEps)
+    assert np.all(np.abs(zNears - zFars) > _nonZeroEps)
+    if degree:
+        fovys = np.deg2rad(fovys)
+
+    tanHalf = np.tan(fovys / 2.0)
+
+    result = _get_output((fovys.size, 4, 4), out)
+    result[:, 0, 0] = 1.0 / (aspects * tanHalf)
+    result[:, 1, 1] = 1.0 / tanHalf
+    result[:, 2, 2] = -(zFars + zNears) / (zFars - zNears)
+    result[:, 3, 2] = -1.0
+    result[:, 2, 3] = -(2.0 * zFars * zNears) / (zFars - zNears)
+
+    return result
@@ -16,6 +16,14 @@ class GLUniform:
         self.programId = programId
         self.name = name
 
+        # the program must be linked at this point
+        self.location = glGetUniformLocation(self.programId, self.name)
+
+        # uniform values are kept by the program, so unchanged values need not be uploaded again
+        self._lastValue = None
+        self.numIssued = 0
+        self.numSkipped = 0
+
         if dtype == 'float':
             self._valUpdateFunc = self._valUpdateDirect
             self._uniformFunc = glUniform1f
@@ -50,22 +58,195 @@ class GLUniform:
             raise RuntimeError('invalid dtype {}'.format(dtype))
 
     def _valUpdateDirect(self, val):
-        location = glGetUniformLocation(self.programId, self.name)
-        self._uniformFunc(location, val)
+        if val == self._lastValue:
+            return False
+        self._uniformFunc(self.location, val)
+        self._lastValue = val
+        return True
 
     def _valUpdatePointer(self, val):
-        location = glGetUniformLocation(self.programId, self.name)
+        valBytes = val.tobytes()
+        if valBytes == self._lastValue:
+            return False
         matrixPtr = self._pointerFunc(val)
-        self._uniformFunc(location, 1, matrixPtr)
+        self._uniformFunc(self.location, 1, matrixPtr)
+        self._lastValue = valBytes
+        return True
 
     def _valUpdateMatrixPointer(self, val):
-        location = glGetUniformLocation(self.programId, self.name)
+        valBytes = val.tobytes()
+        if valBytes == self._lastValue:
+            return False
         matrixPtr = self._pointerFunc(val)
         # transpose set to true to transform from row major to column major
-        self._uniformFunc(location, 1, GL_TRUE, matrixPtr)
+        self._uniformFunc(self.location, 1, GL_TRUE, matrixPtr)
+        self._lastValue = valBytes
+        return True
 
+    # the program must be in use
+    # returns whether the value is uploaded
     def update(self, val):
-        self._valUpdateFunc(val)
+        if self._valUpdateFunc(val):
+            self.numIssued += 1
+            return True
+        self.numSkipped += 1
+        return False
+
+    # forget the last value so that the next update is always uploaded
+    def invalidate(self):
+        self._lastValue = None
+
+    def reset_counters(self):
+        self.numIssued = 0
+        self.numSkipped = 0
+
+
+# sums up the upload counters of a collection of GLUniform
+def get_uniform_upload_counts(uniforms):
+    if isinstance(uniforms, dict):
+        uniforms = uniforms.values()
+    numIssued = 0
+    numSkipped = 0
+    for uniform in uniforms:
+        numIssued += uniform.numIssued
+        numSkipped += uniform.numSkipped
+    return numIssued, numSkipped
+
+
+class GLUniformBlock:
+
+    # blockDtype: a structured dtype whose fields are float32/int32/uint32 scalars,
+    # 2/3/4-component vectors, 4x4 matrices, or arrays of 4-component vectors or 4x4 matrices
+    # the fields are laid out in std140, matrices are row major like in GLUniform
+    def __init__(self, blockName, blockDtype, bindingPoint):
+        self.blockName = blockName
+        self.bindingPoint = bindingPoint
+        self.dtype = self._get_std140_dtype(np.dtype(blockDtype))
+
+        self.data = np.zeros(1, self.dtype)
+        self._dataBytes = self.data.view(np.uint8)
+        self._dirty = True
+        self.numIssued = 0
+        self.numSkipped = 0
+
+        self.bufferId = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.bufferId)
+        glBufferData(GL_UNIFORM_BUFFER, self.dtype.itemsize, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, self.bindingPoint, self.bufferId)
+
+    @staticmethod
+    def _get_std140_alignment(shape):
+        if shape == ():
+            return 4, 4
+        if shape in ((2,), (3,), (4,)):
+            return {2: 8, 3: 16, 4: 16}[shape[0]], 4 * shape[0]
+        if shape == (4, 4):
+            return 16, 64
+        if len(shape) == 2 and shape[1] == 4:
+            return 16, 16 * shape[0]
+        if len(shape) == 3 and shape[1:] == (4, 4):
+            return 16, 64 * shape[0]
+        raise RuntimeError('unsupported uniform block field shape {}'.format(shape))
+
+    def _get_std140_dtype(self, blockDtype):
+        names = []
+        formats = []
+        offsets = []
+        offset = 0
+        for name in blockDtype.names:
+            fieldDtype = blockDtype.fields[name][0]
+            baseDtype, shape = fieldDtype.base, fieldDtype.shape
+            if baseDtype not in (np.dtype(np.float32), np.dtype(np.int32), np.dtype(np.uint32)):
+                raise RuntimeError('unsupported uniform block field type {}'.format(baseDtype))
+
+            alignment, size = self._get_std140_alignment(shape)
+            offset = (offset + alignment - 1) // alignment * alignment
+            names.append(name)
+            formats.append(fieldDtype)
+            offsets.append(offset)
+            offset += size
+
+        # the size of a block is rounded up to the alignment of vec4
+        itemSize = (offset + 15) // 16 * 16
+        return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemSize})
+
+    # binds the block to the program if the program declares it
+    # returns whether the program declares the block
+    def bind_to_program(self, program):
+        programId = program.get_program_id()
+        blockIndex = glGetUniformBlockIndex(programId, self.blockName)
+        if blockIndex == GL_INVALID_INDEX:
+            return False
+        glUniformBlockBinding(programId, blockIndex, self.bindingPoint)
+        return True
+
+    def bind_to_programs(self, programs):
+        return [self.bind_to_program(program) for program in programs]
+
+    # only changes the local copy, call upload() to send it to the GPU
+    def update(self, name, val):
+        val = np.asarray(val, self.dtype.fields[name][0].base)
+        if val.shape[-2:] == (4, 4):
+            # std140 matrices are column major
+            val = np.swapaxes(val, -1, -2)
+        if not np.array_equal(self.data[name][0], val):
+            self.data[name][0] = val
+            self._dirty = True
+
+    # uploads the whole block with one buffer update if anything has changed
+    def upload(self):
+        if not self._dirty:
+            self.numSkipped += 1
+            return False
+        glBindBuffer(GL_UNIFORM_BUFFER, self.bufferId)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.dtype.itemsize, self._dataBytes)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        self._dirty = False
+        self.numIssued += 1
+        return True
+
+    def delete(self):
+        if self.bufferId != 0:
+            glDeleteBuffers(1, [self.bufferId])
+        self.bufferId = 0
+
+
+# a buffer whose whole content is replaced every frame
+# each upload orphans the old storage with glBufferData(None) first, so the driver does not have to wait
+# for draw calls still reading it, then copies the new content with one glBufferSubData
+class GLStreamingBuffer:
+
+    def __init__(self, size, target=GL_ARRAY_BUFFER):
+        # size: in bytes
+        self.size = size
+        self.target = target
+        self.numUploads = 0
+
+        self.bufferId = glGenBuffers(1)
+        glBindBuffer(self.target, self.bufferId)
+        glBufferData(self.target, self.size, None, GL_STREAM_DRAW)
+        glBindBuffer(self.target, 0)
+
+    # array: a C contiguous array of exactly size bytes, uploaded without any conversion
+    def upload(self, array):
+        assert array.flags['C_CONTIGUOUS'] and array.nbytes == self.size
+        glBindBuffer(self.target, self.bufferId)
+        glBufferData(self.target, self.size, None, GL_STREAM_DRAW)
+        glBufferSubData(self.target, 0, self.size, array)
+        glBindBuffer(self.target, 0)
+        self.numUploads += 1
+
+    def bind(self):
+        glBindBuffer(self.target, self.bufferId)
+
+    def unbind(self):
+        glBindBuffer(self.target, 0)
+
+    def delete(self):
+        if self.bufferId != 0:
+            glDeleteBuffers(1, [self.bufferId])
+        self.bufferId = 0
 
 
 class GLProgram:
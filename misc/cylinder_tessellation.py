@@ -1,4 +1,5 @@
 import numpy as np
+from misc.tessellation_util import grid_triangles
 
 
 def _circle_pos(theta):
@@ -31,44 +32,93 @@ class _Triangle:
             self.normals[i, :] /= norms[i]
 
 
-def uniform_tessellate_half_cylinder(hStep = 12, vStep = 12):
+# returns a (numTriangles * 3, 6) array of interleaved positions and normals, three rows per triangle
+def uniform_tessellate_half_cylinder_array(hStep = 12, vStep = 12, dtype = np.float32):
     assert hStep > 1 and vStep > 1
 
     thetaTicks = np.linspace(0.0, np.pi, hStep)
     vTicks = np.linspace(0.0, 1.0, vStep)
 
     hPos = _circle_pos(thetaTicks)
+    cylinderGrid = hPos[None, :, :] + vTicks[:, None, None] * np.asarray([0.0, 1.0, 0.0])
 
-    cylinderGrid = []
+    gridNormals = np.copy(cylinderGrid)
+    gridNormals[:, :, 1] = 0.0
+    gridNormals /= np.linalg.norm(gridNormals, axis=2)[:, :, None]
 
-    for i in range(vStep):
-        gridPos = hPos + np.asarray([0.0, vTicks[i], 0.0])
-        cylinderGrid.append(gridPos)
+    return grid_triangles(cylinderGrid, gridNormals, dtype)
 
-    cylinderGrid = np.asarray(cylinderGrid)
 
-    triVertexIndex1 = ([0, 2, 1], ...)
-    triVertexIndex2 = ([1, 2, 3], ...)
+# kept for callers that work with _Triangle objects
+def uniform_tessellate_half_cylinder(hStep = 12, vStep = 12):
+    data = uniform_tessellate_half_cylinder_array(hStep, vStep, np.float64).reshape((-1, 3, 6))
 
     triangles = []
-
-    # create triangles
-    for i in range(vStep - 1):
-        for j in range(hStep - 1):
-            vertexIndices = (
-                [i, i, i + 1, i + 1],
-                [j, j + 1, j, j + 1]
-            )
-            vertices = cylinderGrid[vertexIndices]
-
-            triangle1 = _Triangle(vertices[triVertexIndex1], True)
-            triangle2 = _Triangle(vertices[triVertexIndex2], True)
-            triangles.append(triangle1)
-            triangles.append(triangle2)
+    for triData in data:
+        triangle = _Triangle(triData[:, :3])
+        triangle.normals = triData[:, 3:]
+        triangles.append(triangle)
 
     return triangles
 
 
+# a full cylinder (radius 1, from y = 0 to y = 1) without duplicated vertices, for glDrawElements
+# hStep: number of ticks on [0, 2pi] (the last tick is the same as the first one)
+# vStep: number of ticks along the height
+# withCaps: also close the top and bottom with discs
+# returns (vertexData, indices): an N x 6 float32 array of interleaved positions and normals,
+# and a flat uint32 array of triangle indices
+def uniform_tessellate_cylinder(hStep = 23, vStep = 12, withCaps = False):
+    assert hStep > 2 and vStep > 1
 
+    thetaTicks = np.linspace(0.0, 2.0 * np.pi, hStep)[:-1]
+    vTicks = np.linspace(0.0, 1.0, vStep)
+    numTheta = thetaTicks.size
 
-
+    hPos = _circle_pos(thetaTicks)
+    sidePos = (hPos[None, :, :] + vTicks[:, None, None] * np.asarray([0.0, 1.0, 0.0])).reshape((-1, 3))
+    sideNormals = np.tile(hPos, (vStep, 1))
+
+    # vertex indices on the side, the column after the last one wraps around to the first one
+    sideIndices = np.arange(vStep * numTheta).reshape((vStep, numTheta))
+    sideIndicesNext = np.roll(sideIndices, -1, axis=1)
+
+    tris1 = np.stack([
+        sideIndices[:-1],
+        sideIndices[1:],
+        sideIndicesNext[:-1]
+    ], axis=2).reshape((-1, 3))
+
+    tris2 = np.stack([
+        sideIndicesNext[:-1],
+        sideIndices[1:],
+        sideIndicesNext[1:]
+    ], axis=2).reshape((-1, 3))
+
+    positions = [sidePos]
+    normals = [sideNormals]
+    triangles = [tris1, tris2]
+
+    if withCaps:
+        # caps need their own vertices because the normals are different from the side
+        numVertices = sidePos.shape[0]
+        for height, normalY in ((0.0, -1.0), (1.0, 1.0)):
+            center = numVertices
+            ring = numVertices + 1 + np.arange(numTheta)
+            ringNext = np.roll(ring, -1)
+            capPos = np.concatenate([[[0.0, height, 0.0]], hPos + np.asarray([0.0, height, 0.0])], axis=0)
+
+            positions.append(capPos)
+            normals.append(np.tile([0.0, normalY, 0.0], (numTheta + 1, 1)))
+            # keep counterclockwise winding when viewed from outside
+            if normalY < 0.0:
+                triangles.append(np.stack([np.full(numTheta, center), ring, ringNext], axis=1))
+            else:
+                triangles.append(np.stack([np.full(numTheta, center), ringNext, ring], axis=1))
+            numVertices += numTheta + 1
+
+    vertexData = np.concatenate([np.concatenate(positions, axis=0), np.concatenate(normals, axis=0)],
+                                axis=1).astype(np.float32)
+    indices = np.concatenate(triangles, axis=0).astype(np.uint32).flatten()
+
+    return vertexData, indices
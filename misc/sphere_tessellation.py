@@ -1,4 +1,5 @@
 import numpy as np
+from misc.tessellation_util import grid_triangles
 
 
 def _sphere_pos(theta, phi):
@@ -29,7 +30,8 @@ class _Triangle:
             self.normals[i, :] /= norms[i]
 
 
-def uniform_tessellate_half_sphere(thetaStep = 15, phiStep = 30):
+# returns a (numTriangles * 3, 6) array of interleaved positions and normals, three rows per triangle
+def uniform_tessellate_half_sphere_array(thetaStep = 15, phiStep = 30, dtype = np.float32):
     assert thetaStep > 1 and phiStep > 1
 
     thetaTicks = np.linspace(np.pi / 2.0, 0, thetaStep)
@@ -38,28 +40,76 @@ def uniform_tessellate_half_sphere(thetaStep = 15, phiStep = 30):
     tv, pv = np.meshgrid(thetaTicks, phiTicks, indexing='ij')
     sphereGrid = _sphere_pos(tv, pv)
 
-    triVertexIndex1 = ([0, 2, 1], ...)
-    triVertexIndex2 = ([1, 2, 3], ...)
+    gridNormals = sphereGrid / np.linalg.norm(sphereGrid, axis=2)[:, :, None]
 
-    triangles = []
+    return grid_triangles(sphereGrid, gridNormals, dtype)
 
-    # create triangles
-    for i in range(thetaStep - 1):
-        for j in range(phiStep - 1):
-            vertexIndices = (
-                [i, i, i + 1, i + 1],
-                [j, j + 1, j, j + 1]
-            )
-            vertices = sphereGrid[vertexIndices]
 
-            triangle1 = _Triangle(vertices[triVertexIndex1], True)
-            triangle2 = _Triangle(vertices[triVertexIndex2], True)
-            triangles.append(triangle1)
-            triangles.append(triangle2)
+# kept for callers that work with _Triangle objects
+def uniform_tessellate_half_sphere(thetaStep = 15, phiStep = 30):
+    data = uniform_tessellate_half_sphere_array(thetaStep, phiStep, np.float64).reshape((-1, 3, 6))
 
-    return triangles
+    triangles = []
+    for triData in data:
+        triangle = _Triangle(triData[:, :3])
+        triangle.normals = triData[:, 3:]
+        triangles.append(triangle)
 
+    return triangles
 
 
+# a closed sphere without duplicated vertices, for glDrawElements
+# thetaStep: number of ticks from the north pole to the south pole (including both poles)
+# phiStep: number of ticks on [0, 2pi] (the last tick is the same as the first one)
+# returns (vertexData, indices): an N x 6 float32 array of interleaved positions and normals,
+# and a flat uint32 array of triangle indices
+def uniform_tessellate_sphere(thetaStep = 29, phiStep = 30):
+    assert thetaStep > 2 and phiStep > 2
 
+    thetaTicks = np.linspace(0, np.pi, thetaStep)[1:-1]
+    phiTicks = np.linspace(0, 2.0 * np.pi, phiStep)[:-1]
+    numRings = thetaTicks.size
+    numPhi = phiTicks.size
 
+    tv, pv = np.meshgrid(thetaTicks, phiTicks, indexing='ij')
+    ringPos = _sphere_pos(tv, pv).reshape((-1, 3))
+
+    # north pole, rings, south pole
+    positions = np.concatenate([[[0.0, 0.0, 1.0]], ringPos, [[0.0, 0.0, -1.0]]], axis=0)
+    northPole = 0
+    southPole = positions.shape[0] - 1
+
+    # vertex indices on the rings, the column after the last one wraps around to the first one
+    ringIndices = 1 + np.arange(numRings * numPhi).reshape((numRings, numPhi))
+    ringIndicesNext = np.roll(ringIndices, -1, axis=1)
+
+    northCap = np.stack([
+        np.full(numPhi, northPole),
+        ringIndices[0],
+        ringIndicesNext[0]
+    ], axis=1)
+
+    bands1 = np.stack([
+        ringIndices[:-1],
+        ringIndices[1:],
+        ringIndicesNext[:-1]
+    ], axis=2).reshape((-1, 3))
+
+    bands2 = np.stack([
+        ringIndicesNext[:-1],
+        ringIndices[1:],
+        ringIndicesNext[1:]
+    ], axis=2).reshape((-1, 3))
+
+    southCap = np.stack([
+        ringIndices[-1],
+        np.full(numPhi, southPole),
+        ringIndicesNext[-1]
+    ], axis=1)
+
+    indices = np.concatenate([northCap, bands1, bands2, southCap], axis=0).astype(np.uint32).flatten()
+
+    # positions on a unit sphere are also the normals
+    vertexData = np.concatenate([positions, positions], axis=1).astype(np.float32)
+
+    return vertexData, indices
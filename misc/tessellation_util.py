@@ -0,0 +1,25 @@
+import numpy as np
+
+
+# split each quad of a (rows, cols, 3) grid into two triangles, in the order of rows, cols,
+# then the two triangles of the quad
+# returns a (numTriangles * 3, 6) array of interleaved positions and normals, three rows per triangle
+def grid_triangles(grid, gridNormals, dtype):
+    numRows, numCols = grid.shape[0] - 1, grid.shape[1] - 1
+    result = np.empty((numRows, numCols, 2, 3, 6), dtype)
+
+    for gridData, components in ((grid, slice(0, 3)), (gridNormals, slice(3, 6))):
+        v0 = gridData[:-1, :-1]
+        v1 = gridData[:-1, 1:]
+        v2 = gridData[1:, :-1]
+        v3 = gridData[1:, 1:]
+
+        # triangle 1: v0, v2, v1, triangle 2: v1, v2, v3
+        result[:, :, 0, 0, components] = v0
+        result[:, :, 0, 1, components] = v2
+        result[:, :, 0, 2, components] = v1
+        result[:, :, 1, 0, components] = v1
+        result[:, :, 1, 1, components] = v2
+        result[:, :, 1, 2, components] = v3
+
+    return result.reshape((-1, 6))